@@ -1,32 +1,33 @@
+import argparse
+import glob
 import os
-from dotenv import load_dotenv
-from pdf2image import convert_from_path
-from typing import List, Dict, Tuple
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Dict, Tuple
 import json
-import openai
-from PIL import Image
-from prompt import extract_part_data, image_to_base64
+from prompt import extract_part_data, MODEL, PROMPT_VERSION
+from cache import ExtractionCache, get_cache
+from preprocess import prepare_page
+from schema import MAX_REPAIRS, RepairBudget, confidence, validate_result
+from text_layer import extract_text_tables, page_count
 from tabulate import tabulate
-from collections import defaultdict
+from collections import deque
 import csv 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from sorting import optimize_by_material, save_cut_plan_csv
-
-try:
-    import streamlit as st
-    openai.api_key = st.secrets["OPENAI_API_KEY"]
-except Exception as e:
-    st.error("""
-        OpenAI API key not found in Streamlit Secrets. 
-        For public repos, configure keys via:
-        App Settings → Secrets (⚙️) → Add OPENAI_API_KEY
-        """)
-    st.stop()  # Halt execution
+from parts import PartTable
+from sorting import optimize_by_material, oversize_parts, rejected_parts, save_cut_plan_csv, save_cut_plan_pdf, save_cut_plan_json
+from instrument import span, start_run, submit
+from inventory import MIN_REMNANT, load_catalog, load_inventory, parse_stock, save_inventory, update_inventory
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+MAX_IN_FLIGHT = max(1, int(os.getenv("COPPER_MAX_IN_FLIGHT", "4")))  # concurrent GPT-4o page calls
+PAGE_CHUNK = 2  # pages rendered per poppler call while streaming
+CROP_TO_TABLE = os.getenv("COPPER_CROP", "1") != "0"  # send only the detected parts table
+NATIVE_TEXT = os.getenv("COPPER_NATIVE_TEXT", "1") != "0"  # parse CAD text layers before using vision
 
-    
-# Load environment variables
-# load_dotenv()
-# openai.api_key = os.getenv("OPENAI_API_KEY")
 '''
 def pdf_to_images(pdf_path):
     try:
@@ -38,37 +39,165 @@ def pdf_to_images(pdf_path):
         return convert_from_path(pdf_path, dpi=300, poppler_path=poppler_path)
 '''
 
-def pdf_to_images(pdf_path: str) -> List[Image.Image]:
-    """PDF to image conversion using system poppler"""
+def iter_pdf_pages(pdf_path: str, dpi: int = 300, chunk_size: int = PAGE_CHUNK, skip: Iterable[int] = ()) -> Iterator[Tuple[int, "Image.Image"]]:
+    """Render a PDF lazily as (page number, image), chunk_size pages per poppler call, so only a small window of pages is ever in memory.
+
+    Pages listed in skip (1-based) are not rendered. A render failure is raised, so the package is reported as
+    failed instead of silently losing its remaining pages.
+    """
+    from pdf2image import convert_from_path, pdfinfo_from_path  # loaded on first render, not at import
+
+    skip = set(skip)
     try:
-        return convert_from_path(
-            pdf_path,
-            dpi=300,  # Optimal balance of quality/speed
-            fmt='jpeg',  # Smaller files than PNG
-            thread_count=4  # Parallel processing
-        )
+        page_count = pdfinfo_from_path(pdf_path)["Pages"]
+        wanted = [n for n in range(1, page_count + 1) if n not in skip]
+        while wanted:
+            # Render runs of consecutive pages together, at most chunk_size at a time.
+            first = last = wanted.pop(0)
+            while wanted and wanted[0] == last + 1 and last - first + 1 < chunk_size:
+                last = wanted.pop(0)
+            with span("pdf.render", first=first, last=last, dpi=dpi):
+                images = convert_from_path(
+                    pdf_path,
+                    dpi=dpi,
+                    fmt='jpeg',  # Smaller files than PNG
+                    first_page=first,
+                    last_page=last,
+                )
+            yield from zip(range(first, last + 1), images)
     except Exception as e:
-        st.error(f"PDF conversion failed: {str(e)}")
-        return []
+        print(f"PDF conversion failed: {str(e)}")
+        raise
+
+def pdf_to_images(pdf_path: str) -> List["Image.Image"]:
+    """PDF to image conversion using system poppler"""
+    return [img for _, img in iter_pdf_pages(pdf_path)]
+
+def _validated_extraction(prepared, budget: RepairBudget = None) -> Dict:
+    """Extract a page and validate it; pages that fail are re-queried with a repair prompt while the PDF's budget lasts.
 
-def process_pdf(pdf_path: str) -> Tuple[List[Dict], List[Dict]]:
-    """Process a PDF file and extract part data"""
+    The best attempt is kept, with its remaining problems, repair count and confidence.
+    """
+    result = extract_part_data(prepared.base64, mime=prepared.mime)
+    best, problems = validate_result(result)
+    repairs = 0
+    # API failures were already retried; only malformed or invalid answers are worth a repair prompt.
+    while problems and ("error" not in result or "raw" in result) and repairs < MAX_REPAIRS and budget is not None and budget.take():
+        repairs += 1
+        previous = result.get("raw") if "raw" in result else json.dumps({k: v for k, v in result.items() if k != "rejected"})
+        with span("page.repair", attempt=repairs, problems=len(problems)):
+            result = extract_part_data(prepared.base64, mime=prepared.mime, repair=(previous, problems[:20]))
+        candidate, candidate_problems = validate_result(result)
+        if len(candidate_problems) <= len(problems) and "error" not in candidate:
+            best, problems = candidate, candidate_problems
+    best.update(problems=problems, repairs=repairs, confidence=confidence(best, repairs))
+    return best
+
+def _extract_page(img: "Image.Image", budget: RepairBudget = None) -> Tuple[Dict, Dict]:
+    """Crop/encode one rendered page and run it through the vision extractor, reusing cached results.
+
+    Returns the extraction result and the payload metrics for the page.
+    """
+    prepared = prepare_page(img, crop=CROP_TO_TABLE)
+    metrics = {"source": "vision", "cropped": prepared.region is not None, "bytes_sent": prepared.bytes_sent, "bytes_full": prepared.bytes_full, "size": prepared.size}
+
+    cache = get_cache()
+    if cache is None:
+        return _validated_extraction(prepared, budget), metrics
+
+    key = ExtractionCache.key(prepared.base64, MODEL, PROMPT_VERSION)
+    with span("cache.lookup") as attrs:
+        result = cache.get(key)
+        attrs["hit"] = result is not None
+    if result is None:
+        result = _validated_extraction(prepared, budget)
+        if "error" not in result and not result["problems"]:  # never pin a failed or invalid page in the cache
+            cache.put(key, result)
+    return result, metrics
+
+def _format_bytes(n: int) -> str:
+    return f"{n / 1024:.0f} KB" if n < 1024 * 1024 else f"{n / 1024 / 1024:.1f} MB"
+
+def process_pdf(pdf_path: str, max_in_flight: int = MAX_IN_FLIGHT, pages: List[Dict] = None,
+                on_page: Callable[[int, Dict], None] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Process a PDF file and extract part data, with up to max_in_flight pages at the API at once
+
+    If pages is a list, one report per page (source, confidence, repairs, rejected rows) is appended to it.
+    on_page(page number, metrics) is called as each page's extraction finishes, for live progress.
+    max_in_flight below 1 is treated as 1.
+    """
+    max_in_flight = max(1, max_in_flight)
     if not os.path.exists(pdf_path):
         print(f"File not found: {pdf_path}")
         return [], []
 
-    images = pdf_to_images(pdf_path)
-    if not images:
+    # CAD-exported pages are parsed straight from the text layer; only the rest go to GPT-4o.
+    results = {}
+    if NATIVE_TEXT:
+        with span("pdf.text_layer") as attrs:
+            for number, result in extract_text_tables(pdf_path).items():
+                results[number] = (result, {"source": "text"})
+                if on_page:
+                    on_page(number, results[number][1])
+            attrs["pages"] = len(results)
+        if results:
+            print(f"\nParsed {len(results)} page(s) from the PDF text layer.")
+
+    print(f"\nExtracting remaining pages, {max_in_flight} at a time...")
+    cache = get_cache()
+    before = cache.stats() if cache else None
+    budget = RepairBudget()
+    pending = deque()
+
+    def collect():
+        number, future = pending.popleft()
+        results[number] = future.result()
+        if on_page:
+            on_page(number, results[number][1])
+
+    # Pages are rendered on this thread while earlier pages are at the API; waiting on the
+    # oldest call once max_in_flight are pending caps how many rendered pages are held.
+    # When the text layer covered every page there is nothing to render (and poppler is not needed).
+    rendered = iter_pdf_pages(pdf_path, skip=results) if len(results) != page_count(pdf_path) else iter(())
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for number, img in rendered:
+            pending.append((number, submit(pool, _extract_page, img, budget)))
+            while len(pending) >= max_in_flight:
+                collect()
+        while pending:
+            collect()
+    if not results:
         return [], []
+    if cache:
+        after = cache.stats()
+        print(f"Extraction cache: {after['hits'] - before['hits']} hit(s), {after['misses'] - before['misses']} miss(es), {after['entries']} entries")
+    vision = [m for _, m in results.values() if m["source"] == "vision"]
+    sent = sum(m["bytes_sent"] for m in vision)
+    full = [m["bytes_full"] for m in vision if m["bytes_full"]]
+    print(f"Payload: {_format_bytes(sent)} sent for {len(vision)} page(s)" + (f" vs {_format_bytes(sum(full))} as full-page PNG" if full else ""))
 
     all_parts = []
     kanban_parts = []
     
-    for i, img in enumerate(images):
-        print(f"\nProcessing page {i + 1}/{len(images)}...")
-        img_base64 = image_to_base64(img)
-        result = extract_part_data(img_base64)
-        
+    for i in sorted(results):
+        result, metrics = results[i]
+        if metrics["source"] == "text":
+            print(f"Page {i}: parsed from text layer")
+        else:
+            payload = f"sent {_format_bytes(metrics['bytes_sent'])} at {metrics['size'][0]}x{metrics['size'][1]}"
+            if CROP_TO_TABLE and not metrics["cropped"]:
+                payload += ", no table grid detected so the whole page"
+            if metrics["bytes_full"]:
+                payload += f" (full page: {_format_bytes(metrics['bytes_full'])})"
+            print(f"Page {i}: {payload}")
+
+        score = result.get("confidence", 1.0) if result else 0.0
+        for problem in (result or {}).get("problems", []):
+            print(f"Page {i}: ⚠️ {problem}")
+        if pages is not None:
+            pages.append({"page": i, "source": metrics["source"], "confidence": score, "repairs": result.get("repairs", 0),
+                          "rows": len(result.get("parts", [])), "rejected": result.get("rejected", []), "problems": result.get("problems", [])})
+
         if result and result.get("table_found", False):
             mtg_no = result.get("mtg_no", "UNKNOWN")
             parts = result.get("parts", [])
@@ -89,64 +218,170 @@ def process_pdf(pdf_path: str) -> Tuple[List[Dict], List[Dict]]:
                     all_parts.append(part)
                     page_regular_parts += 1
 
-            print(f"Page {i + 1}: {page_regular_parts} regular, {page_kanban_parts} KANBAN (MTG: {mtg_no})")
+            print(f"Page {i}: {page_regular_parts} regular, {page_kanban_parts} KANBAN (MTG: {mtg_no}), confidence {score:.2f}")
         else:
-            print("No target table found on this page.")
+            print(f"Page {i}: no target table found.")
 
     return all_parts, kanban_parts
 
 
-def group_by_material(parts):
-    """Group parts by material and summarize quantities"""
-    grouped = defaultdict(list)
-    
-    for part in parts:
-        material_key = part.get("material", "Unknown").strip().upper()
-        grouped[material_key].append(part)
-    return grouped
+def collect_pdfs(paths: Iterable[str]) -> List[str]:
+    """Expand files, directories (searched recursively) and glob patterns into a sorted list of PDFs"""
+    found = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = glob.glob(os.path.join(path, "**", "*.pdf"), recursive=True) + glob.glob(os.path.join(path, "**", "*.PDF"), recursive=True)
+        else:
+            matches = glob.glob(path, recursive=True) or ([path] if os.path.isfile(path) else [])
+        found.update(os.path.abspath(m) for m in matches if m.lower().endswith(".pdf"))
+    return sorted(found)
+
+def _timed_process(pdf_path: str, max_in_flight: int) -> Tuple[List[Dict], List[Dict], List[Dict], float]:
+    start = time.time()
+    pages = []
+    with span("pdf.process", file=os.path.basename(pdf_path)):
+        regular, kanban = process_pdf(pdf_path, max_in_flight, pages)
+    return regular, kanban, pages, time.time() - start
 
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extract parts from MTG packages and build one consolidated copper cut plan.")
+    parser.add_argument("paths", nargs="+", help="PDF files, directories or glob patterns")
+    parser.add_argument("-o", "--out", default=".", help="output directory (default: current directory)")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="PDF packages extracted concurrently (default: 4)")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="concurrent API calls per package")
+    parser.add_argument("--formats", default="csv,pdf,json", help="comma-separated outputs: csv, pdf, json")
+    parser.add_argument("--master-length", type=float, default=144.0, help="stock bar length in inches")
+    parser.add_argument("--stock", type=parse_stock, help='stock lengths and cost per bar for every material, e.g. "120:0.85,144:1" (default: master length at cost 1)')
+    parser.add_argument("--catalog", help="per-material stock catalog JSON: {\"MATERIAL\": [[length, cost], ...]}, overrides --stock")
+    parser.add_argument("--kerf", type=float, default=0.0, help="saw kerf lost at every cut, inches (e.g. 0.125)")
+    parser.add_argument("--trim", type=float, default=0.0, help="end trim taken off every bar before cutting, inches")
+    parser.add_argument("--strategy", choices=["exact", "greedy", "auto"], default="auto", help="cut optimizer engine")
+    parser.add_argument("--time-limit", type=float, default=30.0, help="solver time budget per material (seconds)")
+    parser.add_argument("--solver-workers", type=int, default=None, help="processes for material solves (default: CPU count)")
+    parser.add_argument("--inventory", help="offcut inventory JSON: remnants are cut first, then it is updated with new offcuts")
+    parser.add_argument("--min-remnant", type=float, default=MIN_REMNANT, help=f"shortest offcut kept in the inventory, inches (default: {MIN_REMNANT:g})")
+    parser.add_argument("--trace-log", default=None, help="append per-stage timing spans to this JSON-lines file (default: COPPER_TRACE_LOG)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print extracted parts and every bar")
+    return parser.parse_args(argv)
 
-def main():
-    pdf_files = [
-        "mtgpkgMTG292158.pdf",  # Replace with your actual PDF files    
-        #"mtgpkgMTG288863.pdf",
-    ]
+def main(argv=None) -> int:
+    """Headless batch run: extract every package, pool all cuttable parts, and optimize them together"""
+    args = parse_args(argv)
+    with start_run("cli") as run:
+        code = _run_batch(args)
+    print(tabulate([[r["stage"], r["calls"], f"{r['seconds']:.2f}", f"{r['mean']:.3f}", f"{r['max']:.2f}", r["total_tokens"] or ""] for r in run.breakdown()],
+                   headers=["Stage", "Calls", "Total (s)", "Mean (s)", "Max (s)", "Tokens"], tablefmt="github"))
+    run.write_jsonl(args.trace_log)
+    return code
+
+def _run_batch(args: argparse.Namespace) -> int:
+    pdf_files = collect_pdfs(args.paths)
+    if not pdf_files:
+        print("No PDF files found.")
+        return 1
+
+    run_start = time.time()
+    timings = {}
     all_regular_parts = []
     all_kanban_parts = []
+    failed = []
+    page_reports = {}
 
-    for pdf_path in pdf_files:
-        print(f"\nProcessing PDF: {pdf_path}")
-        regular_parts, kanban_parts = process_pdf(pdf_path)
-        all_regular_parts.extend(regular_parts)
-        all_kanban_parts.extend(kanban_parts)
-
-    filename = f"grouped_parts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-    print("\n=== Extraction Results ===")
-    print(json.dumps({
-        "regular_parts": all_regular_parts,
-        "kanban_parts": all_kanban_parts
-    }, indent=2))
+    print(f"Processing {len(pdf_files)} PDF package(s), {args.workers} at a time...")
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {path: submit(pool, _timed_process, path, args.max_in_flight) for path in pdf_files}
+        for path in pdf_files:  # merge in a stable order regardless of completion order
+            try:
+                regular_parts, kanban_parts, pages, elapsed = futures[path].result()
+            except Exception as e:
+                print(f"Failed to process {path}: {e}")
+                failed.append(path)
+                continue
+            all_regular_parts.extend(regular_parts)
+            all_kanban_parts.extend(kanban_parts)
+            page_reports[path] = pages
+            print(f"{os.path.basename(path)}: {len(regular_parts)} regular, {len(kanban_parts)} KANBAN in {elapsed:.1f}s")
+    timings["extraction"] = time.time() - run_start
 
+    if args.verbose:
+        print("\n=== Extraction Results ===")
+        print(json.dumps({
+            "regular_parts": all_regular_parts,
+            "kanban_parts": all_kanban_parts
+        }, indent=2))
 
     if not all_regular_parts and not all_kanban_parts:
         print("\nNo part data extracted from any PDF.")
-        return  
+        return 1
 
     cuttable_parts = [p for p in all_regular_parts if p.get("size") not in [None, "", 0]]
     non_cuttable_parts = [p for p in all_regular_parts if p.get("size") in [None, "", 0]]
-
     print(f"\nCuttable parts: {len(cuttable_parts)}, Non-cuttable: {len(non_cuttable_parts)}")
 
+    inventory = load_inventory(args.inventory) if args.inventory else {}
+    catalog = {"*": args.stock} if args.stock else {}
+    if args.catalog:
+        catalog.update(load_catalog(args.catalog))
+    start = time.time()
+    table = PartTable.from_records(cuttable_parts)
+    cut_plans = optimize_by_material(table, args.master_length, strategy=args.strategy, time_limit=args.time_limit,
+                                     max_workers=args.solver_workers, verbose=args.verbose, remnants=inventory, catalog=catalog,
+                                     kerf=args.kerf, trim=args.trim)
+    timings["optimization"] = time.time() - start
 
-    cut_plans = optimize_by_material(cuttable_parts)
-
+    oversize = oversize_parts(cut_plans)
     extras = {
         "KANBAN Items": all_kanban_parts,
-        "Other Items": non_cuttable_parts
+        "Other Items": non_cuttable_parts,
+        "Oversize Items": oversize,
+        "Rejected Items": rejected_parts(table)
+    }
+
+    start = time.time()
+    os.makedirs(args.out, exist_ok=True)
+    stem = os.path.join(args.out, f"cut_plan_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    formats = {f.strip().lower() for f in args.formats.split(",") if f.strip()}
+    summary = {
+        "packages": len(pdf_files),
+        "failed": failed,
+        "regular_parts": len(all_regular_parts),
+        "kanban_parts": len(all_kanban_parts),
+        "pages": page_reports,
+        "materials": {m: {"bars": len(p), "remnants_used": sum(p.from_remnant), "cost": p.cost, "lower_bound": p.lower_bound, "gap": round(p.gap, 4), "status": p.status, "solve_time": round(p.solve_time, 3)} for m, p in cut_plans.items()},
+        "timings": timings,
     }
+    if "csv" in formats:
+        with span("output.csv"):
+            save_cut_plan_csv(cut_plans, stem + ".csv", extras=extras, master_length=args.master_length)
+    if "pdf" in formats:
+        with span("output.pdf"):
+            save_cut_plan_pdf(cut_plans, stem + ".pdf", extras=extras, master_length=args.master_length)
+    timings["output"] = time.time() - start
+    timings["total"] = time.time() - run_start
+    if "json" in formats:
+        save_cut_plan_json(cut_plans, stem + ".json", extras=extras, master_length=args.master_length, summary=summary)
+
+    if args.inventory:
+        save_inventory(args.inventory, update_inventory(inventory, cut_plans, args.min_remnant))
 
-    save_cut_plan_csv(cut_plans, filename, extras=extras)
-    print(f"\nCut plan + KANBAN + Other items saved to {filename}") 
+    bars = sum(len(p) for p in cut_plans.values())
+    reused = sum(sum(p.from_remnant) for p in cut_plans.values())
+    used = sum(u for p in cut_plans.values() for _, u in p)
+    stock = sum(sum(p.stock_lengths) for p in cut_plans.values())
+    print(f"\n=== Summary ===")
+    print(f"Packages: {len(pdf_files) - len(failed)} ok, {len(failed)} failed")
+    doubtful = [(path, p) for path, pages in page_reports.items() for p in pages if p["confidence"] < 1.0]
+    for path, page in doubtful:
+        print(f"Check {os.path.basename(path)} page {page['page']}: confidence {page['confidence']:.2f}, {len(page['rejected'])} row(s) rejected after {page['repairs']} repair(s)")
+    for part in oversize:
+        print(f"Oversize: {part['material']} part {part['part_no']} ({part['size']}\" x {part['unit_qty']}) is longer than any stock bar and is not in the plan")
+    cost = sum(p.cost for p in cut_plans.values())
+    print(f"Bars: {bars - reused} new + {reused} remnant(s) across {len(cut_plans)} material(s), cost {cost:g}, utilization {100 * used / stock if stock else 0:.1f}%")
+    if args.inventory:
+        print(f"Inventory: {args.inventory}")
+    print("Timing: " + ", ".join(f"{k} {v:.1f}s" for k, v in timings.items()))
+    print(f"Outputs: {', '.join(stem + '.' + f for f in sorted(formats))}")
+    return 0 if not failed else 2
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,110 +1,207 @@
 import streamlit as st
+import multiprocessing
 import os
-import tempfile
-import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from Copper import process_pdf 
-from sorting import optimize_by_material, save_cut_plan_csv, save_cut_plan_pdf
-import pandas as pd
+from prompt import resolve_api_key
+from sorting import stock_length_of, offcut_of
+from jobs import ACTIVE, DEFAULT_PATH, JobStore, Workers
+from inventory import parse_stock
+import json
 
 #openai.api_key = st.secrets["OPENAI_API_KEY"]
 
-from pdf2image import convert_from_path
+# Heavy modules (Copper's PDF stack, pandas, OpenAI, OR-Tools, reportlab) load on first use, so the upload
+# widget renders before any of them are imported. `python benchmark.py --imports` checks the budget.
 
 st.set_page_config(page_title="Copper Cut Plan Optimizer", layout="wide")
 st.title("📄 Copper Cut Plan Optimizer")
 
+STATUS_ICONS = {"queued": "⏳", "extracting": "🔄", "optimizing": "🧮", "done": "✅", "failed": "❌"}
+
+@st.cache_resource
+def solver_pool() -> ProcessPoolExecutor:
+    """Solver processes shared across sessions and reruns, so OR-Tools is loaded once per worker, not once per Submit."""
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+@st.cache_resource
+def job_workers() -> Workers:
+    """Job queue plus background workers shared by every session. COPPER_JOB_WORKERS=0 leaves the jobs to `python jobs.py`."""
+    store = JobStore(os.getenv("COPPER_JOBS_PATH", DEFAULT_PATH))
+    # The pool is looked up per job, so clearing the cached one after a solver process dies gives the next job a fresh pool.
+    return Workers(store, threads=int(os.getenv("COPPER_JOB_WORKERS", "2")), pool=solver_pool, reset_pool=solver_pool.clear)
+
+# Uploads run as background jobs. The planner id and the open job live in the URL, so a refresh or a
+# closed tab re-attaches to the same work, and each planner's files and plans are reused between jobs.
+if "planner" not in st.query_params:
+    st.query_params["planner"] = uuid.uuid4().hex[:12]
+planner = st.query_params["planner"]
+workers = job_workers()
+store = workers.store
+
+if not os.getenv("COPPER_FAKE_OPENAI") and not resolve_api_key():
+    st.error("""
+        OpenAI API key not found in Streamlit Secrets.
+        For public repos, configure keys via:
+        App Settings → Secrets (⚙️) → Add OPENAI_API_KEY
+        """)
+    st.stop()  # Halt execution
+
+@st.fragment(run_every=1.0)
+def show_progress(job_id: str):
+    """Live per-file, per-page and per-material progress, polled from the job store."""
+    import pandas as pd
+
+    job = store.get(job_id)
+    if job is None or job["status"] not in ("queued", *ACTIVE):
+        st.rerun()  # finished, failed or pruned: the full page run shows what happened
+    if job["status"] == "queued":
+        st.info(f"⏳ Queued behind {job['ahead']} job(s). You can close this page; the job keeps running and stays under 🗂️ Jobs.")
+        return
+    steps = store.steps(job_id)
+    files = [s for s in steps if s["kind"] == "file"]
+    finished = sum(s["status"] in ("done", "reused", "failed") for s in files)
+    pages = sum(s["kind"] == "page" for s in steps)
+    solved = [s for s in steps if s["kind"] == "material"]
+    st.progress(finished / len(files) if files else 0.0,
+                text=f"{STATUS_ICONS[job['status']]} {job['status'].title()}: {finished}/{len(files)} file(s), {pages} page(s) extracted, {len(solved)} material(s) solved")
+    st.dataframe(pd.DataFrame([{"Step": s["kind"].title(), "Item": s["key"], "Status": s["status"],
+                                "Detail": ", ".join(f"{k}: {v}" for k, v in s.items() if k not in ("kind", "key", "status", "updated"))}
+                               for s in steps if s["kind"] != "page"]), use_container_width=True)
+
+def show_result(result: dict, job: dict):
+    """Render a finished job from its stored result; nothing is extracted or solved again."""
+    import pandas as pd
+
+    for name, error in result["failures"]:
+        st.error(f"❌ Failed to process {name}: {error}")
+    doubtful = [p for p in result["pages"] if p["confidence"] < 1.0]
+    if doubtful:
+        st.warning(f"⚠️ {len(doubtful)} page(s) did not fully validate; rejected rows are listed below. Check them against the drawings.")
+        st.dataframe(pd.DataFrame([{"File": p["name"], "Page": p["page"], "Confidence": p["confidence"], "Repairs": p["repairs"],
+                                    "Rows": p["rows"], "Rejected": "; ".join(r["reason"] for r in p["rejected"]) or "; ".join(p["problems"])}
+                                   for p in doubtful]), use_container_width=True)
+
+    rejected = result.get("rejected", [])
+    if rejected:
+        st.warning(f"⚠️ {len(rejected)} row(s) have a size or quantity the solver cannot read and were left out of the plan.")
+        st.dataframe(pd.DataFrame(rejected), use_container_width=True)
+
+    reused = result["reused_files"]
+    st.success(f"✅ Processing complete in {result['elapsed']:.2f} seconds." + (f" ♻️ {reused} file(s) reused from earlier jobs." if reused else ""))
+
+    all_kanban_parts, non_cuttable = result["kanban"], result["non_cuttable"]
+    if not result["regular"] and not all_kanban_parts:
+        st.warning("⚠️ No parts extracted from uploaded PDFs.")
+    else:
+        cut_plans = result["plans"]
+        st.caption(f"🔁 Re-solved {len(result['resolved'])} of {len(cut_plans)} material(s); the rest are unchanged.")
+
+        timestamp = datetime.fromtimestamp(job["created"]).strftime("%Y%m%d_%H%M%S")
+        csv_file = f"cut_plan_{timestamp}.csv"
+        pdf_file = f"cut_plan_{timestamp}.pdf"
+
+        st.subheader("📊 Optimized Cut Plan")
+        for material, plans in cut_plans.items():
+            st.markdown(f"### 🧱 Material: `{material}` — cost {plans.cost:g}")
+            rows = []
+            for i, (cuts, used) in enumerate(plans, 1):
+                stock = stock_length_of(plans, i - 1)
+                label = f"Bar {i} ♻️ {stock}\"" if plans.from_remnant[i - 1] else f"Bar {i}"
+                for j, (length, mtg, name, part_no) in enumerate(cuts, 1):
+                    rows.append({
+                        "Bar": label,
+                        "Stock (in)": stock if j == 1 else None,
+                        "Cut": f"Cut {j}",
+                        "Length (in)": length,
+                        "Part No.": part_no,
+                        "Part Name": name,
+                        "MTG #": mtg,
+                        "Remaining": offcut_of(plans, i - 1) if j == 1 else None
+                    })
+            df = pd.DataFrame(rows)
+            st.dataframe(df, use_container_width=True)
+
+        if all_kanban_parts:
+            st.subheader("📦 KANBAN Items")
+            st.dataframe(pd.DataFrame(all_kanban_parts), use_container_width=True)
+
+        if non_cuttable:
+            st.subheader("❌ Non-Cuttable Items")
+            st.dataframe(pd.DataFrame(non_cuttable), use_container_width=True)
+
+        oversize = result.get("oversize", [])
+        if oversize:
+            st.subheader("📏 Oversize Items")
+            st.error(f"❌ {sum(p['unit_qty'] for p in oversize)} cut(s) are longer than every stock bar and are not in the plan.")
+            st.dataframe(pd.DataFrame(oversize), use_container_width=True)
+
+        st.download_button("⬇️ Download CSV", result["csv"], file_name=csv_file, mime="text/csv")
+        st.download_button("⬇️ Download PDF", result["pdf"], file_name=pdf_file, mime="application/pdf")
+        st.download_button("⬇️ Download Updated Inventory", json.dumps(result["inventory"], indent=2), file_name=f"inventory_{timestamp}.json", mime="application/json")
+
+    st.subheader("⏱️ Run Breakdown")
+    st.dataframe(pd.DataFrame(result["breakdown"]).round(3), use_container_width=True)
+    if result["solves"]:
+        st.dataframe(pd.DataFrame(result["solves"]), use_container_width=True)
+
 uploaded_files = st.file_uploader(
     "Upload one or more PDF files", type=["pdf"], accept_multiple_files=True
 )
 
+with st.sidebar:
+    st.header("🪚 Stock & Saw")
+    stock_spec = st.text_input("Stock lengths (length:cost per bar)", "144:1", help='e.g. "120:0.85,144:1" - the plan minimizes total cost')
+    kerf = st.number_input("Kerf (in)", min_value=0.0, value=0.0, step=0.0625, format="%.4f")
+    trim = st.number_input("End trim per bar (in)", min_value=0.0, value=0.0, step=0.125, format="%.3f")
+    try:
+        stock_catalog = parse_stock(stock_spec)
+    except ValueError:
+        st.error("❌ Stock lengths must look like 120:0.85,144:1")
+        st.stop()
+
+    recent = store.recent(planner)
+    if recent:
+        st.header("🗂️ Jobs")
+        for job in recent:
+            started = datetime.fromtimestamp(job["created"]).strftime("%b %d %H:%M")
+            if st.button(f"{STATUS_ICONS.get(job['status'], '')} {started} · {job['label']}", key=f"job-{job['id']}", use_container_width=True):
+                st.query_params["job"] = job["id"]
+                st.rerun()
+
+inventory_file = st.file_uploader("Offcut inventory (optional JSON: {\"MATERIAL\": [[length, count], ...]})", type=["json"])
+inventory = {}
+if inventory_file:
+    try:
+        inventory = {m.strip().upper(): [(float(l), int(c)) for l, c in pieces] for m, pieces in json.load(inventory_file).items()}
+        st.caption(f"♻️ {sum(c for pieces in inventory.values() for _, c in pieces)} remnant(s) on hand across {len(inventory)} material(s)")
+    except (ValueError, TypeError, AttributeError) as e:
+        st.error(f"❌ Could not read inventory: {e}")
+        st.stop()
+
 if uploaded_files:
     MAX_PDF_SIZE = 10 * 1024 * 1024  # 10MB
     for file in uploaded_files:
         if file.size > MAX_PDF_SIZE:
             st.error(f"File {file.name} is too large (max {MAX_PDF_SIZE//1_000_000}MB)")
             st.stop()
-            
+
     st.info(f"📥 {len(uploaded_files)} file(s) uploaded. Click 'Submit' to process.")
     if st.button("🚀 Submit"):
-
-        all_regular_parts = []
-        all_kanban_parts = []
-
-        start_time = time.time()
-        progress = st.progress(0, text="🔄 Starting PDF processing...")
-
-        for idx, uploaded_file in enumerate(uploaded_files):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                tmp.write(uploaded_file.getbuffer())
-                tmp_path = tmp.name
-
-            try:
-                regular, kanban = process_pdf(tmp_path)
-                all_regular_parts.extend(regular)
-                all_kanban_parts.extend(kanban)
-            except Exception as e:
-                st.error(f"❌ Failed to process {uploaded_file.name}: {e}")
-            finally:
-                os.remove(tmp_path)
-
-            percent_complete = int((idx + 1) / len(uploaded_files) * 100)
-            progress.progress((idx + 1) / len(uploaded_files), text=f"Processing file {idx + 1}/{len(uploaded_files)} ({percent_complete}%)")
-
-        elapsed = time.time() - start_time
-        st.success(f"✅ Processing complete in {elapsed:.2f} seconds.")
-
-        if not all_regular_parts and not all_kanban_parts:
-            st.warning("⚠️ No parts extracted from uploaded PDFs.")
-        else:
-            cuttable = [p for p in all_regular_parts if p.get("size") not in [None, "", 0]]
-            non_cuttable = [p for p in all_regular_parts if p.get("size") in [None, "", 0]]
-
-            cut_plans = optimize_by_material(cuttable)
-            extras = {
-                "KANBAN Items": all_kanban_parts,
-                "Other Items": non_cuttable
-            }
-
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            csv_file = f"cut_plan_{timestamp}.csv"
-            pdf_file = f"cut_plan_{timestamp}.pdf"
-
-            save_cut_plan_csv(cut_plans, csv_file, extras)
-            save_cut_plan_pdf(cut_plans, pdf_file, extras)
-
-            st.subheader("📊 Optimized Cut Plan")
-            for material, plans in cut_plans.items():
-                st.markdown(f"### 🧱 Material: `{material}`")
-                rows = []
-                for i, (cuts, used) in enumerate(plans, 1):
-                    for j, (length, mtg, name, part_no) in enumerate(cuts, 1):
-                        rows.append({
-                            "Bar": f"Bar {i}",
-                            "Cut": f"Cut {j}",
-                            "Length (in)": length,
-                            "Part No.": part_no,
-                            "Part Name": name,
-                            "MTG #": mtg,
-                            "Remaining": round(144 - used, 2) if j == 1 else None
-                        })
-                df = pd.DataFrame(rows)
-                st.dataframe(df, use_container_width=True)
-
-            if all_kanban_parts:
-                st.subheader("📦 KANBAN Items")
-                st.dataframe(pd.DataFrame(all_kanban_parts), use_container_width=True)
-
-            if non_cuttable:
-                st.subheader("❌ Non-Cuttable Items")
-                st.dataframe(pd.DataFrame(non_cuttable), use_container_width=True)
-
-            with open(csv_file, "rb") as f:
-                st.download_button("⬇️ Download CSV", f, file_name=csv_file, mime="text/csv")
-
-            with open(pdf_file, "rb") as f:
-                st.download_button("⬇️ Download PDF", f, file_name=pdf_file, mime="application/pdf")
-
-            os.remove(csv_file)
-            os.remove(pdf_file)
-
+        job_id = store.submit(planner, [(f.name, bytes(f.getbuffer())) for f in uploaded_files],
+                              {"stock": stock_catalog, "kerf": kerf, "trim": trim, "inventory": inventory})
+        workers.wake()
+        st.query_params["job"] = job_id
+
+job_id = st.query_params.get("job")
+if job_id:
+    job = store.get(job_id)
+    if job is None:
+        st.warning("⚠️ That job no longer exists (jobs are kept for 7 days).")
+    elif job["status"] in ("queued", *ACTIVE):
+        show_progress(job_id)
+    elif job["status"] == "failed":
+        st.error(f"❌ Job failed: {job['error']}")
+    else:
+        show_result(store.result(job_id), job)
@@ -0,0 +1,238 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from tabulate import tabulate
+
+from instrument import start_run
+from sorting import STRATEGIES, optimize_by_material
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+MATERIALS = ["1/4 X 2 BARE CU", "1/4 X 3 BARE CU", "1/8 X 3/4 PLATED CU", "3/8 X 4 BARE CU", "1/4 X 1 TIN PLATED CU", "1/2 X 4 BARE CU"]
+# Bus-bar lengths on our drawings: many short links and straps, fewer risers and long runs.
+SIZE_BANDS = [(0.45, 3.0, 12.0), (0.35, 12.0, 36.0), (0.15, 36.0, 72.0), (0.05, 72.0, 120.0)]
+QTY_CHOICES = [1, 2, 3, 4, 6, 8, 12, 16, 24, 50, 100, 200]
+QTY_WEIGHTS = [30, 20, 10, 12, 8, 6, 5, 3, 2, 2, 1, 1]
+# Cold-start budget (seconds, best of 3 fresh interpreters) for what the web app and the CLI import before any work.
+IMPORT_BUDGET = {"prompt, sorting, jobs, instrument, inventory": 0.4, "Copper": 0.5}
+HEAVY_MODULES = ("openai", "ortools", "reportlab", "pandas", "pdf2image", "pymupdf", "fitz")  # must stay lazy
+RESULT_FIELDS = ["cuts", "distinct", "strategy", "materials", "seconds", "peak_mb", "bars", "lower_bound", "gap_pct", "waste_pct", "optimal"]
+
+
+def generate_parts(num_cuts: int, materials: int = 4, seed: int = 0, distinct_per_material: int = 40) -> List[Dict]:
+    """Synthetic extraction output totalling exactly num_cuts expanded cuts, spread over several materials.
+
+    Lengths are drawn per material from a pool of distinct sizes (in 1/16" steps) so groups repeat sizes the way
+    real packages do; quantities run from 1 to 200, mostly small.
+    """
+    rng = random.Random(seed)
+    names = MATERIALS[:max(1, min(materials, len(MATERIALS)))]
+    pools = {}
+    for material in names:
+        pool = []
+        for _ in range(distinct_per_material):
+            _, low, high = rng.choices(SIZE_BANDS, weights=[b[0] for b in SIZE_BANDS])[0]
+            pool.append(round(rng.uniform(low, high) * 16) / 16)
+        pools[material] = pool
+
+    parts = []
+    remaining = num_cuts
+    while remaining > 0:
+        material = rng.choice(names)
+        qty = min(rng.choices(QTY_CHOICES, weights=QTY_WEIGHTS)[0], remaining)
+        remaining -= qty
+        parts.append({
+            "part_no": str(len(parts) + 1),
+            "part_name": "BUS BAR",
+            "material": material,
+            "size": f"{rng.choice(pools[material]):g}",
+            "unit_qty": qty,
+            "remarks": "",
+            "mtg_no": f"MTG{292000 + len(parts) // 25}",
+        })
+    return parts
+
+
+def run_case(parts: List[Dict], strategy: str, time_limit: float, master_length: float = 144.0, distinct: int = 40) -> Dict:
+    """Solve one workload in-process and measure it. Peak memory covers Python and numpy allocations, not OR-Tools' C++ heap."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    plans = optimize_by_material(parts, master_length, strategy=strategy, time_limit=time_limit, max_workers=1, verbose=False)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    bars = sum(len(p) for p in plans.values())
+    cost = sum(p.cost for p in plans.values())
+    lower_bound = sum(p.lower_bound for p in plans.values())
+    used = sum(u for p in plans.values() for _, u in p)
+    stock = sum(sum(p.stock_lengths) for p in plans.values())
+    return {
+        "cuts": sum(int(p["unit_qty"]) for p in parts),
+        "distinct": distinct,
+        "strategy": strategy,
+        "engines": sorted({p.strategy for p in plans.values()}),
+        "materials": len(plans),
+        "seconds": round(seconds, 4),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "bars": bars,
+        "lower_bound": lower_bound,
+        "gap_pct": round(100 * (cost - lower_bound) / cost, 3) if cost else 0.0,
+        "waste_pct": round(100 * (1 - used / stock), 3) if stock else 0.0,
+        "optimal": all(p.status == "OPTIMAL" for p in plans.values()),
+    }
+
+
+def import_cost(modules: str, repeat: int = 3) -> Dict:
+    """Best-of-repeat wall time to import modules in a fresh interpreter, and which heavy dependencies came with them."""
+    code = ("import json, sys, time; t = time.perf_counter(); import " + modules + "; s = time.perf_counter() - t; "
+            f"print(json.dumps([s, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))")
+    runs = [json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                      cwd=os.path.dirname(os.path.abspath(__file__))).stdout) for _ in range(repeat)]
+    return {"modules": modules, "seconds": round(min(r[0] for r in runs), 3), "heavy": runs[0][1]}
+
+
+def check_imports() -> int:
+    """Print import times against IMPORT_BUDGET; non-zero when over budget or a heavy dependency is imported eagerly."""
+    rows, failed = [], False
+    for modules, budget in IMPORT_BUDGET.items():
+        cost = import_cost(modules)
+        ok = cost["seconds"] <= budget and not cost["heavy"]
+        failed |= not ok
+        rows.append([modules, f"{cost['seconds']:.3f}", f"{budget:.2f}", ", ".join(cost["heavy"]) or "-", "ok" if ok else "OVER"])
+    print(tabulate(rows, headers=["imports", "seconds", "budget", "heavy modules loaded", ""], tablefmt="github"))
+    return 1 if failed else 0
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else 0.0
+
+
+def run_extraction(paths: List[str], max_in_flight: int) -> Dict:
+    """Extract real PDFs through process_pdf against the configured backend and report throughput and page latency.
+
+    Point it at mock_server.py (COPPER_OPENAI_BASE_URL) or COPPER_FAKE_OPENAI=1 to load-test without API credits;
+    set COPPER_CACHE_DISABLE=1 so every page reaches the backend.
+    """
+    from Copper import process_pdf
+
+    with start_run("benchmark") as run:
+        start = time.perf_counter()
+        parts = sum(len(regular) + len(kanban) for regular, kanban in (process_pdf(path, max_in_flight) for path in paths))
+        seconds = time.perf_counter() - start
+    pages = [s for s in run.spans if s["name"] == "api.extract"]
+    latencies = [s["seconds"] for s in pages]
+    calls = [s for s in run.spans if s["name"] == "api.call"]
+    return {
+        "files": len(paths),
+        "max_in_flight": max_in_flight,
+        "pages": len(pages),
+        "parts": parts,
+        "seconds": round(seconds, 3),
+        "pages_per_s": round(len(pages) / seconds, 3) if seconds else 0.0,
+        "p50": round(_percentile(latencies, 50), 3),
+        "p95": round(_percentile(latencies, 95), 3),
+        "p99": round(_percentile(latencies, 99), 3),
+        "calls": len(calls),
+        "failed_calls": sum(1 for s in calls if "error" in s["attrs"]),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline_path: str) -> List[List]:
+    """Rows of (cuts, strategy, time/bars/gap now vs. baseline) for cases present in both runs."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["cuts"], r.get("distinct", 40), r["strategy"]): r for r in json.load(f)["results"]}
+    rows = []
+    for r in results:
+        old = baseline.get((r["cuts"], r["distinct"], r["strategy"]))
+        if old:
+            rows.append([r["cuts"], r["strategy"], f"{old['seconds']:.2f} -> {r['seconds']:.2f}", f"{old['bars']} -> {r['bars']}",
+                         f"{old['gap_pct']:.2f} -> {r['gap_pct']:.2f}", f"{old['peak_mb']:.1f} -> {r['peak_mb']:.1f}"])
+    return rows
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the cut optimizer on synthetic bus-bar workloads.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated expanded cut counts")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES), help="comma-separated solver strategies")
+    parser.add_argument("--materials", type=int, default=4, help="material groups per workload")
+    parser.add_argument("--distinct", default="40,400", help="comma-separated distinct lengths per material (many distinct lengths stress the exact solver)")
+    parser.add_argument("--seed", type=int, default=0, help="workload seed (same seed, same parts)")
+    parser.add_argument("--time-limit", type=float, default=30.0, help="solver budget per material (seconds)")
+    parser.add_argument("--master-length", type=float, default=144.0, help="stock bar length in inches")
+    parser.add_argument("-o", "--out", default=None, help="output stem for .json/.csv (default: benchmarks/bench_<timestamp>)")
+    parser.add_argument("--compare", help="earlier benchmark JSON to diff against")
+    parser.add_argument("--imports", action="store_true", help="only check module import times against IMPORT_BUDGET")
+    parser.add_argument("--pdfs", nargs="+", help="instead of the solver, time extraction of these PDFs (page latency p50/p95/p99, pages/s)")
+    parser.add_argument("--max-in-flight", default="4", help="comma-separated concurrent page calls to try with --pdfs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.imports:
+        return check_imports()
+    if args.pdfs:
+        rows = [run_extraction(args.pdfs, int(n)) for n in args.max_in_flight.split(",") if n.strip()]
+        print(tabulate([list(r.values()) for r in rows], headers=list(rows[0]), tablefmt="github"))
+        return 0
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    strategies = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    results = []
+    distincts = [int(d) for d in args.distinct.split(",") if d.strip()]
+    for cuts in sizes:
+        for distinct in distincts:
+            parts = generate_parts(cuts, args.materials, args.seed, distinct)
+            for strategy in strategies:
+                result = run_case(parts, strategy, args.time_limit, args.master_length, distinct)
+                results.append(result)
+                print(f"{cuts:>6} cuts {distinct:>5} lengths  {strategy:<6} {result['seconds']:8.2f}s  {result['bars']:>5} bars  gap {result['gap_pct']:.2f}%  waste {result['waste_pct']:.2f}%")
+
+    print(tabulate([[r[f] for f in RESULT_FIELDS] for r in results], headers=RESULT_FIELDS, tablefmt="github"))
+
+    stem = args.out or os.path.join("benchmarks", f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    meta = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "materials": args.materials,
+        "time_limit": args.time_limit,
+        "master_length": args.master_length,
+    }
+    with open(stem + ".json", mode="w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    with open(stem + ".csv", mode="w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Results: {stem}.json, {stem}.csv")
+
+    if args.compare:
+        print(tabulate(compare(results, args.compare), headers=["cuts", "strategy", "seconds", "bars", "gap %", "peak MB"], tablefmt="github"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
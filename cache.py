@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "copper_utilization", "extractions.sqlite")
+
+
+class ExtractionCache:
+    """Content-addressed store of extraction results, keyed by page payload + model + prompt version.
+
+    Entries older than max_age_days are dropped, and the least recently used entries are evicted
+    once the stored results exceed max_bytes.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = 256 * 1024 * 1024, max_age_days: float = 30.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            " key TEXT PRIMARY KEY, result TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.commit()
+        self.evict()
+
+    @staticmethod
+    def key(image_base64: str, model: str, prompt_version: str) -> str:
+        digest = hashlib.sha256(f"{model}\0{prompt_version}\0".encode("utf-8"))
+        digest.update(image_base64.encode("ascii"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result FROM extractions WHERE key = ? AND created >= ?", (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE extractions SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict):
+        data = json.dumps(result)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO extractions (key, result, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data), now, now),
+            )
+            self._db.commit()
+        self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until the cache fits in max_bytes."""
+        with self._lock:
+            self._db.execute("DELETE FROM extractions WHERE created < ?", (time.time() - self.max_age,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._db.execute("SELECT key, size FROM extractions ORDER BY accessed").fetchall()
+                doomed = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    total -= size
+                self._db.executemany("DELETE FROM extractions WHERE key = ?", doomed)
+            self._db.commit()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> Optional[ExtractionCache]:
+    """Process-wide cache configured from the environment, or None when COPPER_CACHE_DISABLE is set.
+
+    COPPER_CACHE_PATH, COPPER_CACHE_MAX_MB and COPPER_CACHE_MAX_AGE_DAYS override the defaults.
+    """
+    global _cache
+    if os.getenv("COPPER_CACHE_DISABLE"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ExtractionCache(
+                os.getenv("COPPER_CACHE_PATH", DEFAULT_PATH),
+                max_bytes=int(float(os.getenv("COPPER_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                max_age_days=float(os.getenv("COPPER_CACHE_MAX_AGE_DAYS", "30")),
+            )
+    return _cache
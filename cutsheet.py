@@ -0,0 +1,93 @@
+from typing import List
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import Flowable, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from sorting import PLAN_HEADERS, plan_rows, stock_length_of
+
+PDF_HEADERS = PLAN_HEADERS[:-1] + ["Offcut (in)"]
+PDF_COL_WIDTHS = [42, 46, 40, 54, 50, 150, 80, 53]  # points; sums to the A4 frame width
+PDF_CHUNK_ROWS = 40  # rows per extras table flowable, so long tables never go through platypus' quadratic split
+
+
+class _BarDiagram(Flowable):
+    """Scaled bar layout: end trim, each cut (kerf gaps between them) and the remaining offcut.
+
+    Drawn straight onto the canvas; the reportlab.graphics renderer is several times slower for thousands of bars.
+    """
+
+    def __init__(self, cuts, stock: float, kerf: float, trim: float, height: float = 14):
+        super().__init__()
+        self.cuts, self.stock, self.kerf, self.trim, self.height = cuts, stock, kerf, trim, height
+
+    def wrap(self, avail_width, avail_height):
+        self.width = avail_width
+        return avail_width, self.height + 4
+
+    def draw(self):
+        c, h = self.canv, self.height
+        scale = self.width / self.stock if self.stock else 0
+        c.setLineWidth(0.4)
+        c.setStrokeColor(colors.grey)
+        c.setFillColor(colors.whitesmoke)
+        c.rect(0, 2, self.width, h, stroke=1, fill=1)
+        x = self.trim * scale
+        if self.trim:
+            c.setFillColor(colors.darkgrey)
+            c.rect(0, 2, x, h, stroke=0, fill=1)
+        c.setFont("Helvetica", 6)
+        c.setStrokeColor(colors.steelblue)
+        for j, (length, _, _, _) in enumerate(self.cuts):
+            w = length * scale
+            c.setFillColor(colors.lightsteelblue if j % 2 else colors.lightblue)
+            c.rect(x, 2, w, h, stroke=1, fill=1)
+            if w > 22:
+                c.setFillColor(colors.black)
+                c.drawCentredString(x + w / 2, 2 + h / 2 - 2, f"{length:g}")
+            x += w + self.kerf * scale
+
+
+def _chunked_table(rows: List[List], headers: List[str], col_widths=None) -> List[Table]:
+    """Split a long table into PDF_CHUNK_ROWS-row flowables, each repeating the header."""
+    style = TableStyle([("FONTSIZE", (0, 0), (-1, -1), 7), ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+                        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey), ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+                        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"), ("TOPPADDING", (0, 0), (-1, -1), 1), ("BOTTOMPADDING", (0, 0), (-1, -1), 1)])
+    return [Table([headers] + rows[start:start + PDF_CHUNK_ROWS], colWidths=col_widths, style=style, hAlign="LEFT")
+            for start in range(0, max(len(rows), 1), PDF_CHUNK_ROWS)]
+
+
+def _pdf_story(all_cut_plans, extras, master_length: float) -> List:
+    styles = getSampleStyleSheet()
+    bar_style = TableStyle([("FONTSIZE", (0, 0), (-1, -1), 7), ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+                            ("TOPPADDING", (0, 0), (-1, -1), 1), ("BOTTOMPADDING", (0, 0), (-1, -1), 1)])
+    story = []
+    for material, plans in all_cut_plans.items():
+        story.append(Paragraph(f"Material: {material}", styles["Heading2"]))
+        cost = getattr(plans, "cost", None)
+        if cost is not None:
+            story.append(Paragraph(f"{len(plans)} bar(s), cost {cost:g}, status {getattr(plans, 'status', '') or 'n/a'}", styles["Normal"]))
+        story.append(Table([PDF_HEADERS], colWidths=PDF_COL_WIDTHS, hAlign="LEFT",
+                           style=TableStyle([("FONTSIZE", (0, 0), (-1, -1), 7), ("FONTNAME", (0, 0), (-1, -1), "Helvetica-Bold"),
+                                             ("BACKGROUND", (0, 0), (-1, -1), colors.lightgrey), ("GRID", (0, 0), (-1, -1), 0.25, colors.grey)])))
+        # One small table per bar with its diagram underneath: layout cost stays linear in the number of cuts.
+        for i in range(len(plans)):
+            if plans[i][0]:
+                story.append(Table(plan_rows(plans, i, master_length), colWidths=PDF_COL_WIDTHS, style=bar_style, hAlign="LEFT"))
+            story.append(_BarDiagram(plans[i][0], stock_length_of(plans, i, master_length), getattr(plans, "kerf", 0.0), getattr(plans, "trim", 0.0)))
+        story.append(Spacer(1, 12))
+
+    for label, rows in (extras or {}).items():
+        story.append(Paragraph(label, styles["Heading2"]))
+        if rows:
+            headers = list(rows[0].keys())
+            story.extend(_chunked_table([[str(row.get(h, "")) for h in headers] for row in rows], headers))
+        story.append(Spacer(1, 12))
+    return story
+
+
+def write_pdf(all_cut_plans, filename, extras=None, master_length=144.0):
+    """Build the cut sheet into filename, a path or a binary buffer."""
+    doc = SimpleDocTemplate(filename, pagesize=A4, leftMargin=40, rightMargin=40, topMargin=40, bottomMargin=40, title="Cut Plan")
+    doc.build(_pdf_story(all_cut_plans, extras, master_length))
@@ -0,0 +1,106 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_LOG = os.path.join(os.path.expanduser("~"), ".cache", "copper_utilization", "trace.jsonl")
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+_run = contextvars.ContextVar("copper_run", default=None)
+_parent = contextvars.ContextVar("copper_span", default=None)
+
+
+class Run:
+    """Spans recorded during one pipeline run (one Submit click or one CLI invocation)."""
+
+    def __init__(self, label: str = ""):
+        self.id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started = time.time()
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def breakdown(self) -> List[Dict]:
+        """One row per stage: call count, total/mean/max seconds and summed token usage, slowest stage first."""
+        stages = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "max": 0.0, **{t: 0 for t in TOKEN_FIELDS}})
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = stages[span["name"]]
+            row["calls"] += 1
+            row["seconds"] += span["seconds"]
+            row["max"] = max(row["max"], span["seconds"])
+            for field in TOKEN_FIELDS:
+                row[field] += span["attrs"].get(field) or 0
+        rows = [{"stage": name, **row, "mean": row["seconds"] / row["calls"]} for name, row in stages.items()]
+        return sorted(rows, key=lambda r: -r["seconds"])
+
+    def write_jsonl(self, path: Optional[str] = None):
+        """Append every span as one JSON line tagged with the run id. COPPER_TRACE_LOG picks the file; COPPER_TRACE_DISABLE turns it off."""
+        if os.getenv("COPPER_TRACE_DISABLE"):
+            return
+        path = path or os.getenv("COPPER_TRACE_LOG", DEFAULT_LOG)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            lines = [json.dumps({"run": self.id, "label": self.label, **span}, default=str) for span in self.spans]
+        with open(path, mode="a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+
+
+@contextmanager
+def start_run(label: str = "") -> Iterator[Run]:
+    """Collect spans from this context (and threads started via submit) into a new Run."""
+    run = Run(label)
+    token = _run.set(run)
+    try:
+        with span("run", label=label):
+            yield run
+    finally:
+        _run.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict]:
+    """Time a block as a child of the current span. Yields the attribute dict so the block can add to it (e.g. token usage)."""
+    run = _run.get()
+    span_id = uuid.uuid4().hex[:8]
+    token = _parent.set(span_id)
+    start = time.time()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _parent.reset(token)
+        if run is not None:
+            run.add({"id": span_id, "parent": _parent.get(), "name": name, "start": start, "seconds": time.time() - start,
+                     "thread": threading.current_thread().name, "attrs": attrs})
+
+
+def record(name: str, seconds: float, **attrs):
+    """Add a span measured elsewhere, e.g. a solve that ran in a worker process."""
+    run = _run.get()
+    if run is not None:
+        run.add({"id": uuid.uuid4().hex[:8], "parent": _parent.get(), "name": name, "start": time.time() - seconds, "seconds": seconds,
+                 "thread": threading.current_thread().name, "attrs": attrs})
+
+
+def submit(pool, fn, *args, **kwargs):
+    """pool.submit that carries the current run and parent span into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def usage_of(response) -> Dict:
+    """Token counts from an OpenAI response (all None when the endpoint does not report usage)."""
+    usage = getattr(response, "usage", None)
+    return {field: getattr(usage, field, None) for field in TOKEN_FIELDS}
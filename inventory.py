@@ -0,0 +1,67 @@
+import json
+import os
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from sorting import offcut_of
+
+MIN_REMNANT = 12.0  # offcuts shorter than this (inches) are scrap, not inventory
+
+Inventory = Dict[str, List[Tuple[float, int]]]
+
+
+def parse_stock(spec: str) -> List[Tuple[float, float]]:
+    """Parse a stock catalog like "120:0.85,144:1" (length:cost per bar; cost defaults to 1)."""
+    catalog = []
+    for item in spec.split(","):
+        if item.strip():
+            length, _, cost = item.partition(":")
+            catalog.append((float(length), float(cost) if cost.strip() else 1.0))
+    return catalog
+
+
+def load_catalog(path: str) -> Dict[str, List[Tuple[float, float]]]:
+    """Read per-material stock catalogs: {"MATERIAL": [[length, cost], ...], "*": [...]}."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {material.strip().upper(): [(float(length), float(cost)) for length, cost in bars] for material, bars in data.items()}
+
+
+def load_inventory(path: str) -> Inventory:
+    """Read an offcut inventory: {"MATERIAL": [[length, count], ...]}. A missing file is an empty inventory."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {material.strip().upper(): [(float(length), int(count)) for length, count in pieces if int(count) > 0] for material, pieces in data.items()}
+
+
+def save_inventory(path: str, inventory: Inventory):
+    with open(path, mode="w", encoding="utf-8") as f:
+        json.dump(dumps_inventory(inventory), f, indent=2)
+
+
+def dumps_inventory(inventory: Inventory) -> Dict[str, List[List[float]]]:
+    """JSON-ready copy, longest pieces first and empty materials dropped."""
+    return {material: [[length, count] for length, count in sorted(pieces, reverse=True)] for material, pieces in sorted(inventory.items()) if pieces}
+
+
+def update_inventory(inventory: Inventory, all_cut_plans, min_length: float = MIN_REMNANT) -> Inventory:
+    """Stock after cutting: remnants the plan used are taken out, offcuts of at least min_length go back in."""
+    updated = {}
+    for material in set(inventory) | set(all_cut_plans):
+        stock = Counter()
+        for length, count in inventory.get(material, []):
+            stock[length] += count
+        plans = all_cut_plans.get(material, [])
+        lengths = getattr(plans, "stock_lengths", None) or []
+        flags = getattr(plans, "from_remnant", None) or []
+        for i in range(len(plans)):
+            if i < len(flags) and flags[i]:
+                stock[lengths[i]] -= 1
+            if i < len(lengths):
+                offcut = offcut_of(plans, i)
+                if offcut >= min_length:
+                    stock[offcut] += 1
+        updated[material] = [(length, count) for length, count in stock.items() if count > 0]
+    return {material: pieces for material, pieces in updated.items() if pieces}
@@ -0,0 +1,376 @@
+import argparse
+import io
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+
+from instrument import span, start_run
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "copper_utilization", "jobs.sqlite")
+ACTIVE = ("extracting", "optimizing")  # a worker owns the job
+STALE_AFTER = 600.0  # seconds without a heartbeat before an active job is presumed orphaned and requeued
+MAX_SESSIONS = 32  # planners whose extraction/plan state workers keep in memory
+
+
+class ClaimLost(Exception):
+    """The job was requeued and claimed by another worker; this worker must leave it alone."""
+
+
+class JobStore:
+    """SQLite-backed job queue: uploads, per-step progress and finished results, shared by the app and its workers.
+
+    A job moves queued -> extracting -> optimizing -> done (or failed). Progress rows are keyed by
+    (kind, key): one per file ("file"), page ("page") and material ("material"). Each claim gets a fresh token,
+    and status changes made with a token only apply while that claim still holds the job.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, max_age_days: float = 7.0):
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, owner TEXT NOT NULL, status TEXT NOT NULL, params TEXT NOT NULL, label TEXT NOT NULL,"
+            " error TEXT, result BLOB, created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);"
+            "CREATE TABLE IF NOT EXISTS job_files ("
+            " job_id TEXT NOT NULL, idx INTEGER NOT NULL, name TEXT NOT NULL, data BLOB NOT NULL, PRIMARY KEY (job_id, idx));"
+            "CREATE TABLE IF NOT EXISTS job_steps ("
+            " job_id TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL, status TEXT NOT NULL, detail TEXT,"
+            " updated REAL NOT NULL, PRIMARY KEY (job_id, kind, key));"
+        )
+        if "claim" not in {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN claim TEXT")
+        self._db.commit()
+        self.prune()
+
+    def submit(self, owner: str, files: List[Tuple[str, bytes]], params: Dict) -> str:
+        """Queue a job for these uploads; params are the run settings (stock, kerf, trim, inventory)."""
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        label = ", ".join(name for name, _ in files[:3]) + (f" +{len(files) - 3}" if len(files) > 3 else "")
+        with self._lock:
+            self._db.execute("INSERT INTO jobs (id, owner, status, params, label, created, updated) VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                             (job_id, owner, json.dumps(params), label, now, now))
+            self._db.executemany("INSERT INTO job_files (job_id, idx, name, data) VALUES (?, ?, ?, ?)",
+                                 [(job_id, i, name, data) for i, (name, data) in enumerate(files)])
+            self._db.commit()
+        return job_id
+
+    def claim(self) -> Optional[Tuple[str, str]]:
+        """Take the oldest queued job for this worker as (job id, claim token), or None. Safe across threads and processes."""
+        with self._lock:
+            while True:
+                row = self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1").fetchone()
+                if row is None:
+                    return None
+                token = uuid.uuid4().hex
+                claimed = self._db.execute("UPDATE jobs SET status = 'extracting', claim = ?, updated = ? WHERE id = ? AND status = 'queued'",
+                                           (token, time.time(), row[0])).rowcount
+                self._db.commit()
+                if claimed:
+                    return row[0], token
+
+    def owns(self, job_id: str, token: str) -> bool:
+        """Whether this claim still holds the job, i.e. it was not requeued and taken by another worker meanwhile."""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM jobs WHERE id = ? AND claim = ?", (job_id, token)).fetchone() is not None
+
+    def heartbeat(self, job_id: str, token: str) -> bool:
+        """Mark a claimed job as alive while it waits or works without recording steps."""
+        with self._lock:
+            alive = self._db.execute("UPDATE jobs SET updated = ? WHERE id = ? AND claim = ?", (time.time(), job_id, token)).rowcount
+            self._db.commit()
+        return bool(alive)
+
+    def set_status(self, job_id: str, status: str, error: Optional[str] = None, token: Optional[str] = None) -> bool:
+        """Move the job to status; with a token, only while that claim still holds it. Returns whether it changed."""
+        with self._lock:
+            changed = self._db.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE id = ?" + (" AND claim = ?" if token else ""),
+                                       (status, error, time.time(), job_id) + ((token,) if token else ())).rowcount
+            self._db.commit()
+        return bool(changed)
+
+    def step(self, job_id: str, kind: str, key: str, status: str, **detail):
+        """Record progress of one file, page or material; doubles as the job's heartbeat."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT INTO job_steps (job_id, kind, key, status, detail, updated) VALUES (?, ?, ?, ?, ?, ?)"
+                             " ON CONFLICT (job_id, kind, key) DO UPDATE SET status = excluded.status, detail = excluded.detail, updated = excluded.updated",
+                             (job_id, kind, key, status, json.dumps(detail, default=str), now))
+            self._db.execute("UPDATE jobs SET updated = ? WHERE id = ?", (now, job_id))
+            self._db.commit()
+
+    def finish(self, job_id: str, result: Dict, token: Optional[str] = None) -> bool:
+        """Store the finished result and drop the uploaded files, which are no longer needed.
+
+        With a token nothing is written unless that claim still holds the job; returns whether it was stored.
+        """
+        with self._lock:
+            done = self._db.execute("UPDATE jobs SET status = 'done', result = ?, error = NULL, updated = ? WHERE id = ?" + (" AND claim = ?" if token else ""),
+                                    (pickle.dumps(result), time.time(), job_id) + ((token,) if token else ())).rowcount
+            if done:
+                self._db.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            self._db.commit()
+        return bool(done)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT id, owner, status, params, label, error, created, updated FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            ahead = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (row[6],)).fetchone()[0]
+        job = dict(zip(("id", "owner", "status", "params", "label", "error", "created", "updated"), row))
+        job["params"] = json.loads(job["params"])
+        job["ahead"] = ahead if job["status"] == "queued" else 0
+        return job
+
+    def files(self, job_id: str) -> List[Tuple[str, bytes]]:
+        with self._lock:
+            return [(name, bytes(data)) for name, data in
+                    self._db.execute("SELECT name, data FROM job_files WHERE job_id = ? ORDER BY idx", (job_id,)).fetchall()]
+
+    def steps(self, job_id: str) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT kind, key, status, detail, updated FROM job_steps WHERE job_id = ? ORDER BY rowid", (job_id,)).fetchall()
+        return [{"kind": kind, "key": key, "status": status, **json.loads(detail or "{}"), "updated": updated} for kind, key, status, detail, updated in rows]
+
+    def result(self, job_id: str) -> Optional[Dict]:
+        """The finished job's result, fetched without recomputing anything."""
+        with self._lock:
+            row = self._db.execute("SELECT result FROM jobs WHERE id = ? AND status = 'done'", (job_id,)).fetchone()
+        return pickle.loads(row[0]) if row and row[0] is not None else None
+
+    def recent(self, owner: str, limit: int = 10) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, status, label, created FROM jobs WHERE owner = ? ORDER BY created DESC LIMIT ?", (owner, limit)).fetchall()
+        return [dict(zip(("id", "status", "label", "created"), row)) for row in rows]
+
+    def requeue_stale(self, after: float = STALE_AFTER) -> int:
+        """Put back active jobs whose worker stopped sending heartbeats (e.g. the server restarted mid-job)."""
+        with self._lock:
+            count = self._db.execute(f"UPDATE jobs SET status = 'queued', claim = NULL WHERE status IN {ACTIVE} AND updated < ?", (time.time() - after,)).rowcount
+            self._db.commit()
+        return count
+
+    def prune(self):
+        """Delete jobs older than max_age_days, with their files and progress."""
+        cutoff = time.time() - self.max_age
+        with self._lock:
+            old = [(job_id,) for job_id, in self._db.execute("SELECT id FROM jobs WHERE created < ?", (cutoff,)).fetchall()]
+            for table in ("job_files", "job_steps"):
+                self._db.executemany(f"DELETE FROM {table} WHERE job_id = ?", old)
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", old)
+            self._db.commit()
+
+
+def _extract_file(store: JobStore, job_id: str, name: str, data: bytes, reports: List[Dict]):
+    """process_pdf on one uploaded file, recording each page as it finishes."""
+    from Copper import process_pdf
+    from session import PlanSession
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp.write(data)
+        tmp_path = tmp.name
+    try:
+        store.step(job_id, "file", name, "extracting")
+        with span("pdf.process", bytes=len(data)):
+            pages = []
+            result = process_pdf(tmp_path, pages=pages,
+                                 on_page=lambda number, metrics: store.step(job_id, "page", f"{name} p{number}", "done", source=metrics["source"]))
+        reports.extend({"file": PlanSession.file_key(data), **p} for p in pages)
+        store.step(job_id, "file", name, "done", pages=len(pages))
+        return result
+    finally:
+        os.remove(tmp_path)
+
+
+def run_job(store: JobStore, job_id: str, session, pool=None, token: Optional[str] = None):
+    """Extract and optimize one job with the planner's PlanSession, storing progress and a result the UI can refetch.
+
+    The result holds the cut plans, parts, page reports, rendered CSV/PDF bytes and the run's timing breakdown.
+    With a claim token, raises ClaimLost before touching the session if another worker has taken the job over.
+    """
+    from inventory import MIN_REMNANT, dumps_inventory, update_inventory
+    from parts import PartTable
+    from sorting import oversize_parts, rejected_parts, save_cut_plan_csv, save_cut_plan_pdf
+
+    if token and not store.owns(job_id, token):
+        raise ClaimLost(job_id)  # its files may already be gone; syncing would wipe the planner's session
+    job = store.get(job_id)
+    params = job["params"]
+    inventory = {m: [tuple(p) for p in pieces] for m, pieces in params.get("inventory", {}).items()}
+    files = store.files(job_id)
+    names = {session.file_key(data): name for name, data in files}
+    with start_run(f"job:{job_id}") as run:
+        start = time.time()
+        for name, _ in files:
+            store.step(job_id, "file", name, "queued")
+        reports, extracted = [], set()
+
+        def extract(data: bytes):
+            extracted.add(session.file_key(data))
+            return _extract_file(store, job_id, names[session.file_key(data)], data, reports)
+
+        with span("extract", files=len(files)):
+            failures = session.sync(files, extract)
+        for name, e in failures:
+            store.step(job_id, "file", name, "failed", error=str(e))
+        for key, name in names.items():
+            if key not in extracted:
+                store.step(job_id, "file", name, "reused")
+        regular, kanban = session.parts()
+        cuttable = [p for p in regular if p.get("size") not in [None, "", 0]]
+        non_cuttable = [p for p in regular if p.get("size") in [None, "", 0]]
+
+        if not store.set_status(job_id, "optimizing", token=token):
+            raise ClaimLost(job_id)
+        cut_plans = session.optimize(cuttable, remnants=inventory, catalog={"*": [tuple(s) for s in params["stock"]]}, kerf=params["kerf"],
+                                     trim=params["trim"], pool=pool,
+                                     on_solved=lambda material, plan: store.step(job_id, "material", material, "done", bars=len(plan), solver=plan.status))
+        for material, plan in cut_plans.items():
+            if material not in session.last_solved:
+                store.step(job_id, "material", material, "reused", bars=len(plan), solver=plan.status)
+
+        oversize = oversize_parts(cut_plans)
+        # Read here rather than from the solve: materials reused from an earlier job are not parsed again.
+        rejected = rejected_parts(PartTable.from_records(cuttable))
+        extras = {"KANBAN Items": kanban, "Other Items": non_cuttable, "Oversize Items": oversize, "Rejected Items": rejected}
+        csv_buffer, pdf_buffer = io.BytesIO(), io.BytesIO()
+        if cut_plans or any(extras.values()):  # KANBAN-only or all-rejected uploads still get their sections
+            with span("output.csv"):
+                save_cut_plan_csv(cut_plans, csv_buffer, extras)
+            with span("output.pdf"):
+                save_cut_plan_pdf(cut_plans, pdf_buffer, extras)
+        elapsed = time.time() - start
+    try:
+        run.write_jsonl()
+    except OSError:
+        pass
+    return {
+        "plans": cut_plans, "regular": regular, "kanban": kanban, "non_cuttable": non_cuttable, "oversize": oversize, "rejected": rejected,
+        "pages": [{**r, "name": names.get(r["file"], r["file"][:8])} for r in reports],
+        "failures": [(name, str(e)) for name, e in failures],
+        "reused_files": len(session.files) - session.last_extracted, "resolved": list(session.last_solved),
+        "csv": csv_buffer.getvalue(), "pdf": pdf_buffer.getvalue(),
+        "inventory": dumps_inventory(update_inventory(inventory, cut_plans, MIN_REMNANT)),
+        "elapsed": elapsed, "breakdown": run.breakdown(),
+        "solves": [{"Material": s["attrs"]["material"], "Seconds": round(s["seconds"], 2), **{k.title(): s["attrs"][k] for k in ("strategy", "status", "bars", "cuts")}}
+                   for s in run.spans if s["name"] == "solve"],
+    }
+
+
+class Workers:
+    """Background threads that claim queued jobs and run them, keeping one PlanSession per planner in memory
+    so resubmits only extract new files and re-solve changed materials.
+
+    pool is the solver executor, or a zero-argument callable returning the current one. When a solver process dies
+    the pool is broken for good: reset_pool() is called so the callable builds a fresh one, and the job is retried once.
+    """
+
+    def __init__(self, store: JobStore, threads: int = 2, pool=None, poll: float = 1.0, reset_pool: Optional[Callable[[], None]] = None):
+        from session import PlanSession
+
+        self.store = store
+        self.pool = pool
+        self.reset_pool = reset_pool
+        self.poll = poll
+        self._pool_lock = threading.Lock()
+        self._new_session = PlanSession
+        self._sessions: "OrderedDict[str, Tuple[object, threading.Lock]]" = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self._wake = threading.Event()
+        store.requeue_stale()
+        self.threads = [threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True) for i in range(threads)]
+        for thread in self.threads:
+            thread.start()
+
+    def wake(self):
+        """Start on a newly submitted job now instead of at the next poll."""
+        self._wake.set()
+
+    def _session(self, owner: str):
+        with self._sessions_lock:
+            if owner not in self._sessions:
+                self._sessions[owner] = (self._new_session(), threading.Lock())
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(owner)
+            return self._sessions[owner]
+
+    def _current_pool(self):
+        return self.pool() if callable(self.pool) else self.pool
+
+    def _run(self, job_id: str, session, token: str):
+        pool = self._current_pool()
+        try:
+            return run_job(self.store, job_id, session, pool, token)
+        except BrokenProcessPool:
+            if self.reset_pool is None:
+                raise
+            print(f"Job {job_id}: a solver process died; restarting the solver pool and retrying.")
+            with self._pool_lock:
+                if self._current_pool() is pool:  # another job may already have replaced it
+                    self.reset_pool()
+            return run_job(self.store, job_id, session, self._current_pool(), token)
+
+    def _loop(self):
+        while True:
+            claimed = self.store.claim()
+            if claimed is None:
+                # Jobs orphaned by a restart only go stale STALE_AFTER after their last heartbeat, so keep checking.
+                self.store.requeue_stale()
+                self._wake.wait(self.poll)
+                self._wake.clear()
+                continue
+            job_id, token = claimed
+            session, lock = self._session(self.store.get(job_id)["owner"])
+            # One job at a time per planner: they share extraction and plan state. Waiting sends no steps, so heartbeat.
+            while not lock.acquire(timeout=STALE_AFTER / 10):
+                self.store.heartbeat(job_id, token)
+            try:
+                result = self._run(job_id, session, token)
+                if not self.store.finish(job_id, result, token):
+                    print(f"Job {job_id} was taken over by another worker; result discarded.")
+            except ClaimLost:
+                print(f"Job {job_id} was taken over by another worker; skipped.")
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                self.store.set_status(job_id, "failed", error=str(e), token=token)
+            finally:
+                lock.release()
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run cut-plan jobs queued by the web app, outside the Streamlit process.")
+    parser.add_argument("--db", default=os.getenv("COPPER_JOBS_PATH", DEFAULT_PATH), help="job queue SQLite file")
+    parser.add_argument("-j", "--workers", type=int, default=2, help="jobs run concurrently")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workers = Workers(JobStore(args.db), threads=args.workers)
+    print(f"Running jobs from {args.db} with {args.workers} worker(s); Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_RESPONSE = '{"table_found": false, "parts": []}'
+ERROR_STATUSES = (429, 500, 503)
+UPSTREAM = "https://api.openai.com/v1/chat/completions"
+IMAGE_URL = re.compile(r"^data:[^;]+;base64,(.*)$", re.DOTALL)
+
+
+class MockAPIError(Exception):
+    """Synthetic HTTP error from the mock endpoint; carries status_code like the OpenAI client's errors."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"mock endpoint returned HTTP {status_code}")
+        self.status_code = status_code
+
+
+def page_hash(messages: List[Dict]) -> Optional[str]:
+    """sha256 of the first image payload in a chat request: the key recordings are stored under."""
+    for message in messages:
+        content = message.get("content")
+        for item in content if isinstance(content, list) else []:
+            if item.get("type") == "image_url":
+                match = IMAGE_URL.match(item["image_url"]["url"])
+                if match:
+                    return hashlib.sha256(match.group(1).encode("ascii")).hexdigest()
+    return None
+
+
+class MockBackend:
+    """Chat-completions stand-in that replays recorded answers per page hash, with injected latency and errors.
+
+    Recordings are <page hash>.json files holding {"content": ..., "usage": {...}}; pages without one get
+    default_response. Latency is latency ± jitter seconds, plus slow seconds on a slow_rate share of calls
+    (the tail). error_rate of calls fail with one of ERROR_STATUSES. Usable in-process (.chat.completions.create)
+    or behind serve().
+    """
+
+    def __init__(self, recordings: Optional[str] = None, default_response: str = DEFAULT_RESPONSE, latency: float = 0.5, jitter: float = 0.0,
+                 slow_rate: float = 0.0, slow: float = 0.0, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.recordings = recordings
+        self.default_response = default_response
+        self.latency, self.jitter, self.slow_rate, self.slow = latency, jitter, slow_rate, slow
+        self.error_rate = error_rate
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.stats = {"calls": 0, "replayed": 0, "errors": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "MockBackend":
+        """Configured from COPPER_FAKE_LATENCY, COPPER_FAKE_JITTER, COPPER_FAKE_ERROR_RATE, COPPER_FAKE_RESPONSE and COPPER_FAKE_RECORDINGS."""
+        return cls(recordings=os.getenv("COPPER_FAKE_RECORDINGS"), default_response=os.getenv("COPPER_FAKE_RESPONSE", DEFAULT_RESPONSE),
+                   latency=float(os.getenv("COPPER_FAKE_LATENCY", "0.5")), jitter=float(os.getenv("COPPER_FAKE_JITTER", "0")),
+                   error_rate=float(os.getenv("COPPER_FAKE_ERROR_RATE", "0")))
+
+    def recording(self, key: Optional[str]) -> Optional[Dict]:
+        if not (self.recordings and key):
+            return None
+        try:
+            with open(os.path.join(self.recordings, key + ".json"), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def reply(self, request: Dict) -> Tuple[int, Dict]:
+        """(HTTP status, body) for a chat-completions request, after the simulated latency."""
+        with self._lock:
+            self.stats["calls"] += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            if self._random.random() < self.slow_rate:
+                delay += self.slow
+            status = self._random.choice(ERROR_STATUSES) if self._random.random() < self.error_rate else 200
+        time.sleep(delay)
+        if status != 200:
+            with self._lock:
+                self.stats["errors"] += 1
+            return status, {"error": {"message": f"injected HTTP {status}", "type": "mock_error", "code": status}}
+
+        key = page_hash(request.get("messages", []))
+        recorded = self.recording(key)
+        if recorded:
+            with self._lock:
+                self.stats["replayed"] += 1
+        content = recorded["content"] if recorded else self.default_response
+        prompt_chars = sum(len(json.dumps(m.get("content", ""))) for m in request.get("messages", []))
+        usage = (recorded or {}).get("usage") or {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4,
+                                                  "total_tokens": prompt_chars // 4 + len(content) // 4}
+        return 200, {
+            "id": f"chatcmpl-mock-{(key or 'none')[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    def create(self, **kwargs):
+        """In-process equivalent of client.chat.completions.create."""
+        status, body = self.reply(kwargs)
+        if status != 200:
+            raise MockAPIError(status)
+        choice = body["choices"][0]
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=choice["message"]["content"]))],
+                               usage=SimpleNamespace(**body["usage"]))
+
+
+def _record_upstream(body: bytes, headers, recordings: str) -> Tuple[int, bytes]:
+    """Forward a request to the real endpoint and save a successful answer under its page hash."""
+    request = urllib.request.Request(UPSTREAM, data=body, method="POST",
+                                     headers={"Content-Type": "application/json", "Authorization": headers.get("Authorization", "")})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            status, payload = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    key = page_hash(json.loads(body).get("messages", []))
+    if key:
+        answer = json.loads(payload)
+        os.makedirs(recordings, exist_ok=True)
+        with open(os.path.join(recordings, key + ".json"), mode="w", encoding="utf-8") as f:
+            json.dump({"content": answer["choices"][0]["message"]["content"], "usage": answer.get("usage")}, f)
+    return status, payload
+
+
+def serve(backend: MockBackend, host: str = "127.0.0.1", port: int = 8765, record: bool = False) -> ThreadingHTTPServer:
+    """HTTP server speaking POST /v1/chat/completions (plus GET /stats). With record=True requests are proxied
+    to the real API and the answers saved into backend.recordings instead of being replayed."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, payload: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404, b'{"error": {"message": "not found"}}')
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if record:
+                return self._send(*_record_upstream(body, self.headers, backend.recordings))
+            status, reply = backend.reply(json.loads(body))
+            self._send(status, json.dumps(reply).encode("utf-8"))
+
+        def do_GET(self):
+            if self.path.rstrip("/") != "/stats":
+                return self._send(404, b'{"error": {"message": "not found"}}')
+            self._send(200, json.dumps(backend.stats).encode("utf-8"))
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible chat endpoint that replays recorded page extractions.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--recordings", default="recordings", help="directory of <page hash>.json answers")
+    parser.add_argument("--record", action="store_true", help="proxy to the real API and save its answers instead of replaying")
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="answer for pages without a recording (JSON text)")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform ± seconds around the latency")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of calls that also take --slow extra seconds")
+    parser.add_argument("--slow", type=float, default=0.0, help="extra seconds for slow calls (tail latency)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with 429/500/503")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    backend = MockBackend(args.recordings, args.response, args.latency, args.jitter, args.slow_rate, args.slow, args.error_rate, args.seed)
+    server = serve(backend, args.host, args.port, record=args.record)
+    print(f"Mock chat endpoint on http://{args.host}:{args.port}/v1 ({'recording' if args.record else 'replaying'} {args.recordings})")
+    print(f"Point the app at it with COPPER_OPENAI_BASE_URL=http://{args.host}:{args.port}/v1 OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(backend.stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class StringPool:
+    """Interned strings stored once, referenced by integer code."""
+
+    __slots__ = ("values", "_codes")
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+
+class PartTable:
+    """Columnar part list: numeric columns as numpy arrays, text columns as codes into shared string pools.
+
+    Quantity stays a count; nothing is expanded per unit until a cut plan is rendered.
+    """
+
+    __slots__ = ("size", "qty", "material", "mtg", "name", "part_no", "pools", "rejected")
+
+    TEXT_COLUMNS = ("material", "mtg", "name", "part_no")
+
+    def __init__(self, size, qty, material, mtg, name, part_no, pools: Dict[str, StringPool], rejected: Optional[List[Tuple[int, Dict, str]]] = None):
+        self.size = np.asarray(size, dtype=np.float64)
+        self.qty = np.asarray(qty, dtype=np.int64)
+        self.material = np.asarray(material, dtype=np.int32)
+        self.mtg = np.asarray(mtg, dtype=np.int32)
+        self.name = np.asarray(name, dtype=np.int32)
+        self.part_no = np.asarray(part_no, dtype=np.int32)
+        self.pools = pools
+        self.rejected = rejected or []  # (row index, record, reason) for rows that could not be parsed
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> "PartTable":
+        """Build from extraction dicts (size, unit_qty, material, mtg_no, part_name, part_no). Unparseable rows go to .rejected."""
+        pools = {column: StringPool() for column in cls.TEXT_COLUMNS}
+        columns = {column: [] for column in ("size", "qty") + cls.TEXT_COLUMNS}
+        rejected = []
+        for index, part in enumerate(records):
+            try:
+                size = float(part.get("size", 0))
+                qty = int(part.get("unit_qty", 0))
+            except (ValueError, TypeError) as e:
+                rejected.append((index, part, f"bad size or quantity: {e}"))
+                continue
+            columns["size"].append(size)
+            columns["qty"].append(qty)
+            columns["material"].append(pools["material"].code(str(part.get("material") or "Unknown").strip().upper()))
+            columns["mtg"].append(pools["mtg"].code(str(part.get("mtg_no") or "UNKNOWN").strip()))
+            columns["name"].append(pools["name"].code(str(part.get("part_name") or "")))
+            columns["part_no"].append(pools["part_no"].code(str(part.get("part_no") or "")))
+        return cls(pools=pools, rejected=rejected, **columns)
+
+    def __len__(self) -> int:
+        return len(self.size)
+
+    def text(self, column: str, rows: np.ndarray) -> List[str]:
+        values = self.pools[column].values
+        return [values[code] for code in getattr(self, column)[rows]]
+
+    def groups(self) -> Dict[str, np.ndarray]:
+        """Row indices per material, materials in first-seen order, rows in input order."""
+        if not len(self):
+            return {}
+        order = np.argsort(self.material, kind="stable")
+        codes, starts = np.unique(self.material[order], return_index=True)
+        chunks = np.split(order, starts[1:])
+        materials = self.pools["material"].values
+        first_seen = sorted(range(len(codes)), key=lambda k: chunks[k][0])
+        return {materials[codes[k]]: chunks[k] for k in first_seen}
+
+    def solver_inputs(self, rows: np.ndarray) -> Tuple[List[Tuple[float, str, str]], List[int], List[str]]:
+        """(sizes, quantities, mtgs) for optimize_cut_plan, one entry per row."""
+        sizes = list(zip(self.size[rows].tolist(), self.text("name", rows), self.text("part_no", rows)))
+        return sizes, self.qty[rows].tolist(), self.text("mtg", rows)
+
+    def total_cuts(self, rows: Optional[np.ndarray] = None) -> int:
+        qty = self.qty if rows is None else self.qty[rows]
+        return int(np.clip(qty, 0, None).sum())
@@ -0,0 +1,210 @@
+import base64
+import io
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from instrument import span
+
+WORK_WIDTH = 1600        # detection runs on a downsampled copy about this wide
+MIN_RULE_FRACTION = 0.15  # a horizontal table rule spans at least this much of the page width
+MIN_SEGMENT = 0.01        # runs shorter than this (fraction of the page side) are text, not rule pieces
+MAX_ROW_GAP = 0.06        # rules further apart than this (fraction of page height) start a new table
+MIN_COLUMNS = 4           # vertical rules needed before a cluster of rules counts as a table
+MAX_SKEW = 2.0            # degrees of scan rotation searched for before detection
+SKEW_STEP = 0.1
+MARGIN = 0.01             # padding around the detected table (fraction of page size)
+API_MAX_SIDE = 2048       # GPT-4o "high" detail fits images in 2048x2048...
+API_MAX_SHORT_SIDE = 768  # ...then scales the short side to 768, so larger uploads are wasted bytes
+
+Region = Tuple[int, int, int, int]
+
+
+class PreparedPage(NamedTuple):
+    base64: str
+    mime: str
+    bytes_sent: int               # encoded payload size actually uploaded
+    bytes_full: Optional[int]     # legacy full-page PNG size, when measured
+    region: Optional[Region]      # crop box in page pixels, None when the whole page was sent
+    size: Tuple[int, int]         # uploaded image dimensions
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Row, start column and length of every run of True in a 2-D mask, in row-major order."""
+    rows, width = mask.shape
+    padded = np.zeros((rows, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)  # row-major order pairs every start with its end
+    return run_rows, starts, ends - starts
+
+
+def _group(indices: np.ndarray) -> List[Tuple[int, int]]:
+    """Collapse sorted indices into (first, last) groups of neighbours - a thick rule becomes one line."""
+    groups = []
+    for i in indices:
+        if groups and i - groups[-1][1] <= 2:
+            groups[-1][1] = i
+        else:
+            groups.append([i, i])
+    return [tuple(g) for g in groups]
+
+
+def _rules(mask: np.ndarray, min_segment: float, min_length: float) -> List[Tuple[int, int, int, int]]:
+    """Straight rules along the rows of mask as (first row, last row, start, end).
+
+    A skewed rule is a staircase of short runs over neighbouring rows, so each rule's extent and length come from
+    the union of the rule-like runs across its rows rather than from the longest single run.
+    """
+    run_rows, starts, lengths = _runs(mask)
+    keep = lengths >= min_segment
+    run_rows, starts, lengths = run_rows[keep], starts[keep], lengths[keep]
+    lines = []
+    for first, last in _group(np.unique(run_rows)):
+        pick = (run_rows >= first) & (run_rows <= last)
+        covered = np.zeros(mask.shape[1] + 1, dtype=np.int32)
+        np.add.at(covered, starts[pick], 1)
+        np.add.at(covered, starts[pick] + lengths[pick], -1)
+        covered = np.cumsum(covered[:-1]) > 0
+        if covered.sum() >= min_length:
+            span_ = np.flatnonzero(covered)
+            lines.append((first, last, int(span_[0]), int(span_[-1]) + 1))
+    return lines
+
+
+def _skew_angle(dark: np.ndarray) -> float:
+    """Scan rotation in degrees (counter-clockwise), found as the angle at which rule-like runs line up best."""
+    height, width = dark.shape
+    run_rows, starts, lengths = _runs(dark)
+    keep = lengths >= MIN_SEGMENT * width
+    if not keep.any():
+        return 0.0
+    x = starts[keep] + lengths[keep] / 2
+    y = run_rows[keep].astype(float)
+    best, best_score = 0.0, 0.0
+    for angle in np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP):
+        # Counter-clockwise rotation lifts the right end of a rule, so y + x tan(angle) is constant along it.
+        shifted = np.round(y + x * np.tan(np.radians(angle))).astype(int)
+        profile = np.bincount(shifted - shifted.min(), weights=lengths[keep])
+        score = float(np.dot(profile, profile))
+        if score > best_score + 1e-9 or (abs(score - best_score) <= 1e-9 and abs(angle) < abs(best)):
+            best, best_score = float(angle), score
+    return round(best, 2)
+
+
+def _unrotate(box: Tuple[int, int, int, int], angle: float, width: int, height: int) -> Tuple[float, float, float, float]:
+    """Bounding box, in the skewed page, of a box found on the copy deskewed by rotating `angle` degrees clockwise."""
+    if not angle:
+        return box
+    left, top, right, bottom = box
+    cx, cy = width / 2, height / 2
+    cos, sin = np.cos(np.radians(angle)), np.sin(np.radians(angle))
+    xs, ys = [], []
+    for x, y in ((left, top), (right, top), (left, bottom), (right, bottom)):
+        xs.append(cx + (x - cx) * cos + (y - cy) * sin)
+        ys.append(cy - (x - cx) * sin + (y - cy) * cos)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def find_table_region(image: Image.Image) -> Optional[Region]:
+    """Locate the ruled parts table as the densest grid of long horizontal and vertical rules.
+
+    Scans are deskewed (up to MAX_SKEW degrees) on the downsampled copy first. Returns a (left, top, right, bottom)
+    crop box in page pixels that holds the whole table on the original page, or None when the page has no grid.
+    """
+    factor = max(1, image.width // WORK_WIDTH)
+    gray = image.convert("L")
+    if factor > 1:
+        gray = gray.reduce(factor)
+    dark = np.asarray(gray) < 160
+    angle = _skew_angle(dark)
+    if angle:
+        dark = np.asarray(gray.rotate(-angle, resample=Image.BILINEAR, fillcolor=255)) < 160
+    height, width = dark.shape
+
+    # Tolerate one pixel of skew or broken scan lines in each direction.
+    horizontal = dark.copy()
+    horizontal[1:] |= dark[:-1]
+    vertical = dark.copy()
+    vertical[:, 1:] |= dark[:, :-1]
+
+    lines = _rules(horizontal, MIN_SEGMENT * width, MIN_RULE_FRACTION * width)
+
+    # Cluster rules that are close together and share the same horizontal extent.
+    clusters = []
+    for line in lines:
+        if clusters:
+            last = clusters[-1]
+            left, right = min(l[2] for l in last), max(l[3] for l in last)
+            overlap = min(right, line[3]) - max(left, line[2])
+            if line[0] - last[-1][1] <= MAX_ROW_GAP * height and overlap >= 0.8 * max(right - left, line[3] - line[2]):
+                last.append(line)
+                continue
+        clusters.append([line])
+
+    best, best_score = None, 0
+    for cluster in clusters:
+        if len(cluster) < 3:
+            continue
+        top, bottom = cluster[0][0], cluster[-1][1]
+        left, right = min(l[2] for l in cluster), max(l[3] for l in cluster)
+        columns = _rules(vertical[top:bottom + 1, left:right].T, MIN_SEGMENT * height, 0.5 * (bottom - top))
+        if len(columns) < MIN_COLUMNS:
+            continue
+        score = len(columns) * len(cluster)
+        if score > best_score:
+            best, best_score = (left, top, right, bottom), score
+
+    if best is None:
+        return None
+    pad_x, pad_y = int(MARGIN * image.width), int(MARGIN * image.height)
+    left, top, right, bottom = (int(v) * factor for v in _unrotate(best, angle, width, height))
+    return (max(0, left - pad_x), max(0, top - pad_y), min(image.width, right + factor + pad_x), min(image.height, bottom + factor + pad_y))
+
+
+def _api_size(width: int, height: int) -> Tuple[int, int]:
+    """Dimensions the vision model will actually look at after its own resizing."""
+    scale = min(1.0, API_MAX_SIDE / max(width, height))
+    scale *= min(1.0, API_MAX_SHORT_SIDE / (min(width, height) * scale))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _encode(image: Image.Image) -> Tuple[bytes, str]:
+    """Encode as grayscale PNG or JPEG, whichever is smaller for this content."""
+    png = io.BytesIO()
+    image.save(png, format="PNG", optimize=True)
+    jpeg = io.BytesIO()
+    image.save(jpeg, format="JPEG", quality=85)
+    if png.tell() <= jpeg.tell():
+        return png.getvalue(), "image/png"
+    return jpeg.getvalue(), "image/jpeg"
+
+
+def prepare_page(image: Image.Image, crop: bool = True, measure: Optional[bool] = None) -> PreparedPage:
+    """Crop a rendered page to its parts table, downscale to what the model uses, and encode it.
+
+    A page where no table grid is found is sent whole (downscaled the same way) rather than dropped, since its
+    parts would otherwise vanish without a trace.
+    measure (default: COPPER_PAYLOAD_METRICS env) also records the legacy full-page PNG size.
+    """
+    if measure is None:
+        measure = bool(os.getenv("COPPER_PAYLOAD_METRICS"))
+    bytes_full = None
+    if measure:
+        legacy = io.BytesIO()
+        image.save(legacy, format="PNG")
+        bytes_full = len(base64.b64encode(legacy.getvalue()))
+
+    with span("page.detect") as attrs:
+        region = find_table_region(image) if crop else None
+        attrs["found"] = region is not None
+    with span("page.encode") as attrs:
+        page = image.crop(region) if region else image
+        page = page.convert("L").resize(_api_size(page.width, page.height), Image.LANCZOS)
+        data, mime = _encode(page)
+        encoded = base64.b64encode(data).decode("utf-8")
+        attrs.update(format=mime, bytes=len(encoded))
+    return PreparedPage(encoded, mime, len(encoded), bytes_full, region, page.size)
@@ -1,23 +1,125 @@
 import json
-from typing import Dict, Optional
-import openai
-from PIL import Image
-import base64
-import io
+from typing import Dict, List, Optional, Tuple
+import os
+import random
 import re
+import threading
+import time
+from instrument import span, usage_of
 
-def image_to_base64(image: Image.Image) -> str:
-    """Convert PIL image to base64 string"""
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+MODEL = "gpt-4o"
+PROMPT_VERSION = "3"  # bump whenever the extraction prompt changes, to invalidate cached results
+RETRY_STATUS = {408, 409, 429}  # plus every 5xx
 
-def extract_part_data(image_base64: str) -> Optional[Dict]:
-    """Extract part specifications using GPT-4o"""
+_client = None
+_client_lock = threading.Lock()
+
+
+def _is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUS or status >= 500
+    import openai
+    return isinstance(error, openai.APIConnectionError)  # includes timeouts
+
+
+def resolve_api_key() -> Optional[str]:
+    """Find the OpenAI key at call time: OPENAI_API_KEY (or a .env file), then Streamlit secrets."""
+    key = os.getenv("OPENAI_API_KEY")
+    if not key:
+        from dotenv import load_dotenv
+        load_dotenv()
+        key = os.getenv("OPENAI_API_KEY")
+    if not key:
+        try:
+            import streamlit as st
+            key = st.secrets["OPENAI_API_KEY"]
+        except Exception:
+            key = None
+    return key
+
+
+def set_client(client):
+    """Route extraction calls through client, anything with .chat.completions.create (None restores the default)."""
+    global _client
+    with _client_lock:
+        _client = client
+
+
+def get_client():
+    """Extraction backend, built on first use and shared by every thread afterwards.
+
+    COPPER_FAKE_OPENAI=1 selects the in-process mock_server.MockBackend. Otherwise an OpenAI client is built
+    with the key resolved at that moment, pointed at COPPER_OPENAI_BASE_URL when set (e.g. a local
+    mock_server.py). The openai package is imported here rather than at module load; it dominates the
+    import time. Retries are left to _create_completion.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if os.getenv("COPPER_FAKE_OPENAI"):
+                from mock_server import MockBackend
+                _client = MockBackend.from_env()
+            else:
+                import openai
+                key = resolve_api_key()
+                if not key:
+                    raise RuntimeError("OPENAI_API_KEY is not set (environment, .env or Streamlit secrets)")
+                _client = openai.OpenAI(api_key=key, base_url=os.getenv("COPPER_OPENAI_BASE_URL") or None, max_retries=0)
+    return _client
+
+
+def _create_completion(retries: int, backoff: float, **kwargs):
+    """Call the chat endpoint, retrying 429/5xx and connection errors with exponential backoff and jitter.
+
+    The whole call, retries included, is one "api.extract" span carrying the response's token usage.
+    """
+    create = get_client().chat.completions.create
+    with span("api.extract", model=kwargs.get("model")) as attrs:
+        for attempt in range(retries + 1):
+            try:
+                with span("api.call", attempt=attempt + 1):
+                    response = create(**kwargs)
+                attrs.update(usage_of(response), attempts=attempt + 1)
+                return response
+            except Exception as e:
+                if attempt == retries or not _is_retryable(e):
+                    raise
+                delay = backoff * 2 ** attempt + random.uniform(0, backoff)
+                print(f"Transient API error ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+
+def _repair_messages(repair: Optional[Tuple[str, List[str]]]) -> List[Dict]:
+    """Follow-up turns asking the model to correct its previous answer for the same image."""
+    if not repair:
+        return []
+    previous, problems = repair
+    return [
+        {"role": "assistant", "content": previous or "(empty response)"},
+        {
+            "role": "user",
+            "content": (
+                "Your answer did not pass validation:\n- " + "\n- ".join(problems) + "\n"
+                "Look at the table again and return the corrected JSON object with the same structure. "
+                "'size' must be a number of inches and 'unit_qty' a whole number."
+            )
+        },
+    ]
+
+
+def extract_part_data(image_base64: str, retries: int = 4, backoff: float = 1.0, mime: str = "image/png",
+                      repair: Optional[Tuple[str, List[str]]] = None) -> Optional[Dict]:
+    """Extract part specifications using GPT-4o in JSON mode.
+
+    repair=(previous answer, problems) re-asks for the same image with the validation problems listed.
+    """
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            #response_format={"type": "json_object"},
+        response = _create_completion(
+            retries,
+            backoff,
+            model=MODEL,
+            response_format={"type": "json_object"},
             messages=[
                 {
                     "role": "system",
@@ -32,7 +134,7 @@ def extract_part_data(image_base64: str) -> Optional[Dict]:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_base64}",
+                                "url": f"data:{mime};base64,{image_base64}",
                                 "detail": "high"
                             }
                         },
@@ -48,7 +150,8 @@ def extract_part_data(image_base64: str) -> Optional[Dict]:
                                 "   - MATERIAL contains specs like '1/8 X 3/4 PLATED CU'\n"
                                 "   - SIZE contains lengths like '13.19\" LG.'\n\n"
                                 "Ensure the 'size' value is a pure numeric string (e.g., '13.19') in inches — remove units like 'LG.', 'IN', and quotation marks.\n"
-                                "\nAlso extract the MTG number from the title block (usually top right). "
+                                "\nAlso extract the MTG number from the title block (usually top right), or from the MTG column of the header row "
+                                "when the image is cropped to the table. "
                                 "Return it as a string field: 'mtg_no'. Apply it to each part row."                                 
                                 "Include the 'remarks' field from the REMARKS column for each part, if available.\n"
                                 "IGNORE ALL OTHER TABLES AND CONTENT.\n"
@@ -69,7 +172,7 @@ def extract_part_data(image_base64: str) -> Optional[Dict]:
                         }
                     ]
                 }
-            ],
+            ] + _repair_messages(repair),
             temperature=0.0  # Maximum determinism
         )
         #return json.loads(response.choices[0].message.content)
@@ -83,16 +186,21 @@ def extract_part_data(image_base64: str) -> Optional[Dict]:
 
         if not content:
             print("Empty response from GPT")
-            return {"table_found": False, "parts": []}
+            return {"table_found": False, "parts": [], "error": "empty response", "raw": ""}
 
         try:
-            return json.loads(content)
+            with span("api.parse", chars=len(content)):
+                result = json.loads(content)
         except json.JSONDecodeError as e:
             print("JSON parsing failed:", e)
             print("Raw GPT response:\n", content)
-            return {"table_found": False, "parts": []}
+            return {"table_found": False, "parts": [], "error": f"invalid JSON: {e}", "raw": content}
+        if not isinstance(result, dict):
+            # Valid JSON but not the object the schema asks for: treated like malformed output, so it can be repaired.
+            return {"table_found": False, "parts": [], "error": "the response is not a JSON object", "raw": content}
+        return result
         
         
     except Exception as e:
         print(f"AI Extraction Error: {str(e)}")
-        return {"table_found": False, "parts": []}
\ No newline at end of file
+        return {"table_found": False, "parts": [], "error": str(e)}
\ No newline at end of file
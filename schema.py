@@ -0,0 +1,95 @@
+import os
+import threading
+from typing import Dict, List, Tuple
+
+from text_layer import parse_size
+
+MAX_REPAIRS = int(os.getenv("COPPER_REPAIR_ATTEMPTS", "2"))  # repair re-queries per page
+REPAIR_BUDGET = int(os.getenv("COPPER_REPAIR_BUDGET", "8"))  # repair re-queries per PDF
+REPAIR_PENALTY = 0.9  # confidence multiplier for every repair a page needed
+
+
+class RepairBudget:
+    """Repair re-queries left for one PDF, shared by its page threads."""
+
+    def __init__(self, total: int = REPAIR_BUDGET):
+        self.left = total
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            if self.left <= 0:
+                return False
+            self.left -= 1
+            return True
+
+
+def _as_int(value) -> int:
+    if isinstance(value, bool):
+        raise ValueError("boolean")
+    number = float(str(value).strip())
+    if not number.is_integer() or number < 0:
+        raise ValueError(value)
+    return int(number)
+
+
+def validate_result(result) -> Tuple[Dict, List[str]]:
+    """Check an extraction against the expected schema and normalize what can be fixed locally.
+
+    Returns the cleaned result (valid rows in "parts", unusable ones in "rejected" with a reason) and the
+    problems a repair prompt should ask the model to fix. A blank size is valid: those parts are non-cuttable.
+    """
+    if not isinstance(result, dict):
+        return {"table_found": False, "parts": [], "rejected": []}, ["the response is not a JSON object"]
+    if "error" in result:
+        return {"table_found": False, "parts": [], "rejected": [], "error": result["error"]}, [result["error"]]
+
+    problems = []
+    parts = result.get("parts", [])
+    if not isinstance(parts, list):
+        problems.append('"parts" must be a list of row objects')
+        parts = []
+    table_found = result.get("table_found", bool(parts))
+    if not isinstance(table_found, bool):
+        table_found = str(table_found).strip().lower() == "true"
+    mtg_no = result.get("mtg_no")
+    if table_found and not (isinstance(mtg_no, str) and mtg_no.strip()):
+        problems.append('"mtg_no" is missing; read it from the title block or the MTG column')
+    if table_found and not parts:
+        problems.append('"table_found" is true but "parts" is empty')
+
+    valid, rejected = [], []
+    for row, part in enumerate(parts, start=1):
+        if not isinstance(part, dict):
+            reason = f"row {row} is not an object"
+        else:
+            label = f"row {row} (part {part.get('part_no', '?')})"
+            try:
+                qty = _as_int(part.get("unit_qty"))
+            except (TypeError, ValueError):
+                reason = f'{label}: "unit_qty" {part.get("unit_qty")!r} is not a whole number'
+            else:
+                size = part.get("size")
+                length = "" if size is None else parse_size(str(size))  # strict: the whole value must be one length
+                if length is None:
+                    reason = f'{label}: "size" {size!r} is not a single length in inches (e.g. "100.4375" for 100 7/16")'
+                else:
+                    valid.append({**{k: "" if v is None else v for k, v in part.items()}, "size": length, "unit_qty": qty,
+                                  "part_no": str(part.get("part_no") or ""), "material": str(part.get("material") or "")})
+                    continue
+        problems.append(reason)
+        rejected.append({"row": part, "reason": reason})
+
+    cleaned = {**result, "table_found": table_found, "parts": valid, "rejected": rejected}
+    if isinstance(mtg_no, str):
+        cleaned["mtg_no"] = mtg_no.strip()
+    return cleaned, problems
+
+
+def confidence(result: Dict, repairs: int = 0) -> float:
+    """Share of the page's rows that validated, discounted for each repair the page needed (1.0 for a clean page)."""
+    if "error" in result:
+        return 0.0
+    total = len(result.get("parts", [])) + len(result.get("rejected", []))
+    share = len(result.get("parts", [])) / total if total else 1.0
+    return round(share * REPAIR_PENALTY ** repairs, 3)
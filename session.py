@@ -0,0 +1,93 @@
+import hashlib
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sorting import CutPlan, material_of, optimize_by_material
+
+Extractor = Callable[[bytes], Tuple[List[Dict], List[Dict]]]
+
+
+class PlanSession:
+    """Extraction results per uploaded file and finished plans per material, kept between runs.
+
+    Files are keyed by content hash, so re-submitting a session only extracts new or changed files,
+    and only materials whose parts or settings changed are re-solved (warm-started from their last plan).
+    """
+
+    def __init__(self):
+        self.files: Dict[str, Tuple[List[Dict], List[Dict]]] = {}  # sha256 -> (regular parts, kanban parts)
+        self.names: Dict[str, str] = {}                            # sha256 -> file name, for messages
+        self.plans: Dict[str, CutPlan] = {}
+        self.signatures: Dict[str, tuple] = {}                     # material -> demand + settings of its plan
+        self.last_extracted = 0
+        self.last_solved: List[str] = []
+
+    @staticmethod
+    def file_key(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def sync(self, uploads: Iterable[Tuple[str, bytes]], extract: Extractor, on_progress: Optional[Callable[[int, int], None]] = None) -> List[Tuple[str, Exception]]:
+        """Make the session match the uploaded files: extract new ones and forget removed ones.
+
+        Returns (file name, error) for every file that failed to extract; those are retried next time.
+        """
+        uploads = list(uploads)
+        keep = []
+        failures = []
+        self.last_extracted = 0
+        for done, (name, data) in enumerate(uploads, start=1):
+            key = self.file_key(data)
+            keep.append(key)
+            if key not in self.files:
+                try:
+                    self.files[key] = extract(data)
+                    self.last_extracted += 1
+                except Exception as e:
+                    failures.append((name, e))
+            self.names[key] = name
+            if on_progress:
+                on_progress(done, len(uploads))
+        order = {key: i for i, key in enumerate(keep)}
+        # Keep upload order so plans come out the same as a from-scratch run.
+        self.files = {key: self.files[key] for key in sorted(self.files, key=lambda k: order.get(k, len(order))) if key in order}
+        self.names = {key: self.names[key] for key in self.files}
+        return failures
+
+    def parts(self) -> Tuple[List[Dict], List[Dict]]:
+        """All regular and KANBAN parts across the session's files, in upload order."""
+        regular, kanban = [], []
+        for file_regular, file_kanban in self.files.values():
+            regular.extend(file_regular)
+            kanban.extend(file_kanban)
+        return regular, kanban
+
+    def optimize(self, part_data: List[Dict], master_length: float = 144.0, strategy: str = "auto", time_limit: float = 30.0,
+                 remnants: Optional[Dict[str, List[Tuple[float, int]]]] = None, catalog: Optional[Dict[str, List[Tuple[float, float]]]] = None,
+                 kerf: float = 0.0, trim: float = 0.0, **kwargs) -> Dict[str, CutPlan]:
+        """optimize_by_material, re-solving only the materials whose demand or settings changed since the last run."""
+        grouped = defaultdict(list)
+        for part in part_data:
+            grouped[material_of(part)].append(part)
+        remnants = {m.strip().upper(): pieces for m, pieces in (remnants or {}).items()}
+        catalog = {m.strip().upper(): bars for m, bars in (catalog or {}).items()}
+
+        signatures = {}
+        for material, parts in grouped.items():
+            demand = tuple(sorted((str(p.get("size")), str(p.get("unit_qty")), str(p.get("mtg_no")), str(p.get("part_name")), str(p.get("part_no"))) for p in parts))
+            stock = tuple(sorted(catalog.get(material, catalog.get("*")) or ()))
+            signatures[material] = (demand, master_length, strategy, kerf, trim, stock, tuple(sorted(remnants.get(material, ()))))
+
+        changed = [m for m in grouped if self.signatures.get(m) != signatures[m]]
+        if changed:
+            solved = optimize_by_material([p for m in changed for p in grouped[m]], master_length, strategy=strategy, time_limit=time_limit,
+                                          remnants=remnants, catalog=catalog, kerf=kerf, trim=trim,
+                                          warm_starts={m: self.plans[m] for m in changed if m in self.plans}, **kwargs)
+            self.plans.update(solved)
+            # A changed material whose rows were all rejected gets no plan back; its old plan is no longer current.
+            for material in changed:
+                if material not in solved:
+                    self.plans.pop(material, None)
+        self.plans = {m: self.plans[m] for m in grouped if m in self.plans}
+        self.signatures = {m: signatures[m] for m in self.plans}
+        self.last_solved = changed
+        return dict(self.plans)
@@ -1,148 +1,685 @@
-from typing import List, Tuple, Dict
+from typing import Callable, List, NamedTuple, Tuple, Dict, Optional
 from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from tabulate import tabulate
+import bisect
 import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-
-'''
-# Best-Fit Decreasing Algorithm (Greedy bin packing)
-def optimize_cut_plan( sizes: List[Tuple[float, str, str]], quantities: List[int], mtgs: List[str], master_length: float) -> List[Tuple[List[Tuple[float, str, str, str]], float]]:
-    
-    # 1. Expand parts with quantities
-    full_sizes = []
-    for (size, part_name, part_no), qty, mtg in zip(sizes, quantities, mtgs):
-        full_sizes.extend([(size, mtg, part_name, part_no)] * qty)
-    
-    # 2. Sort in descending order (critical for BFD)
-    full_sizes.sort(reverse=True, key=lambda x: x[0])
-    
-    # 3. Best-Fit Decreasing Algorithm
-    cut_plans = []
-    
-    for item in full_sizes:
-        size, mtg, part_name, part_no = item
-        best_bin = None
-        min_remaining = master_length  # Track smallest remaining space
-        
-        # Check existing bins for the best fit
-        for i, (cuts, used) in enumerate(cut_plans):
-            remaining = master_length - used
-            if size <= remaining and remaining < min_remaining:
-                min_remaining = remaining
-                best_bin = i
-        
-        # Place the item in the best bin (or start a new one)
-        if best_bin is not None:
-            cuts, used = cut_plans[best_bin]
-            cuts.append(item)
-            cut_plans[best_bin] = (cuts, used + size)
-        else:
-            cut_plans.append(([item], size))
-    
-    return cut_plans
-'''
-def optimize_cut_plan( sizes: List[Tuple[float, str, str]], quantities: List[int], mtgs: List[str], master_length: float) -> List[Tuple[List[Tuple[float, str, str, str]], float]]:
-    # Prepare input
-    full_parts = []
-    for (size, name, part_no), qty, mtg in zip(sizes, quantities, mtgs):
-        full_parts.extend([(size, mtg, name, part_no)] * qty)
-
-    multiplier = 100
-    int_parts = [(int(s * multiplier), mtg, name, part_no) for s, mtg, name, part_no in full_parts]
-    int_lengths = [p[0] for p in int_parts]
-    int_bar_length = int(master_length * multiplier)
-
-    num_items = len(int_parts)
-    num_bins = num_items  # worst case
+import numpy as np
+from instrument import record, span
+from parts import PartTable
+
+SCALE = 100  # solver works in hundredths of an inch
+COST_SCALE = 1000  # CP-SAT needs integer objective coefficients
+STRATEGIES = ("exact", "greedy", "auto")
+AUTO_GREEDY_MIN_CUTS = 5000   # "auto" goes greedy at or above this many expanded cuts...
+AUTO_GREEDY_MAX_TIME = 1.0    # ...or when the time budget is this tight (seconds)...
+AUTO_GREEDY_MIN_WORK = 600_000    # ...or when distinct lengths x bar capacity (pricing work per column-generation round) reaches this
+PARALLEL_MIN_CUTS = 500       # below this, process start-up costs more than the solves
+SOLVER_THREADS = 8            # CP-SAT workers for one solve when it has the machine to itself
+
+Cut = Tuple[float, str, str, str]
+Bar = Tuple[List[Cut], float]
+Column = Tuple[int, Tuple[int, ...]]  # (stock index, pieces of each distinct length)
+
+
+class Stock(NamedTuple):
+    """One kind of bar the solver may cut: fresh stock (unlimited) or a remnant from inventory (limited)."""
+    length: float
+    capacity: int             # usable solver units
+    cost: float               # objective cost per bar
+    available: Optional[int]  # None = unlimited
+    remnant: bool = False
+
+
+class CutPlan(list):
+    """List of (cuts, used) bars for one material, plus solver metadata."""
+
+    def __init__(self, bars=(), lower_bound: float = 0, status: str = "", solve_time: float = 0.0, unplaced: Optional[List[Tuple[Cut, int]]] = None, strategy: str = "",
+                 stock_lengths: Optional[List[float]] = None, from_remnant: Optional[List[bool]] = None, cost: float = 0.0, kerf: float = 0.0, trim: float = 0.0):
+        super().__init__(bars)
+        self.strategy = strategy        # engine that produced the plan: "exact" or "greedy"
+        self.lower_bound = lower_bound  # proven minimum cost (fresh bars when every bar costs 1)
+        self.status = status            # "OPTIMAL" when cost reaches lower_bound, "INCOMPLETE" when parts were left out
+        self.solve_time = solve_time
+        self.unplaced = unplaced or []  # (part, qty) for parts longer than the stock bar
+        self.stock_lengths = stock_lengths or []  # length of the bar each entry was cut from
+        self.from_remnant = from_remnant or []    # True where that bar came out of the offcut inventory
+        self.cost = cost                # total stock cost of the plan
+        self.kerf = kerf                # saw blade width lost per cut
+        self.trim = trim                # squared off the bar ends before cutting
+
+    @property
+    def gap(self) -> float:
+        """Share of the cost not yet proven necessary: 0.0 when OPTIMAL."""
+        return max(self.cost - self.lower_bound, 0.0) / self.cost if self.cost else 0.0
+
+
+def stock_length_of(plans, index: int, default: float = 144.0) -> float:
+    """Stock length of bar `index` in a plan, falling back to `default` for plain lists."""
+    lengths = getattr(plans, "stock_lengths", None)
+    return lengths[index] if lengths else default
+
+
+def offcut_of(plans, index: int, default: float = 144.0) -> float:
+    """Length left over on bar `index` after trim, the cuts and the kerf of every cut."""
+    cuts, used = plans[index]
+    waste = getattr(plans, "trim", 0.0) + getattr(plans, "kerf", 0.0) * len(cuts)
+    return round(max(stock_length_of(plans, index, default) - used - waste, 0.0), 4)
+
+
+def _is_remnant(plans, index: int) -> bool:
+    flags = getattr(plans, "from_remnant", None)
+    return bool(flags and flags[index])
+
+
+def _to_units(length: float) -> int:
+    """Convert inches to integer solver units, rounding up so cuts never overpack a bar."""
+    return math.ceil(round(length * SCALE, 6))
+
+
+def _build_stocks(catalog: List[Tuple[float, float]], remnants: Optional[List[Tuple[float, int]]], kerf: float, trim: float) -> List[Stock]:
+    """Catalog lengths are unlimited at their cost per bar; remnants are already paid for, so they cost nothing but are limited.
+
+    Every piece is charged one kerf, so a bar holds length - trim plus the kerf the last cut does not need.
+    """
+    def capacity(length):
+        return math.floor(round((length - trim + kerf) * SCALE, 6))
+
+    stocks = [Stock(length, capacity(length), float(cost), None) for length, cost in sorted(catalog) if capacity(length) > 0]
+    if not stocks:
+        raise ValueError(f"No usable stock length in {catalog} after {trim}\" trim")
+    for length, count in sorted(remnants or [], reverse=True):
+        if count > 0 and capacity(length) > 0:
+            stocks.append(Stock(length, capacity(length), 0.0, int(count), True))
+    return stocks
+
+
+def _trivial_bound(lengths: List[int], demands: List[int], stocks: List[Stock]) -> float:
+    """Whatever the remnants cannot hold is bought at the best catalog price per unit length."""
+    spare = sum(l * d for l, d in zip(lengths, demands)) - sum(s.capacity * s.available for s in stocks if s.available is not None)
+    return max(spare, 0) * min(s.cost / s.capacity for s in stocks if s.available is None)
+
+
+def _l2_bound(lengths: List[int], demands: List[int], stocks: List[Stock]) -> float:
+    """Martello-Toth L2 bar count on the longest catalog bar, priced at the cheapest bar.
+
+    For each threshold k, pieces longer than half a bar need a bar each, and the pieces between k and half a bar
+    must fit in what those bars leave over (pieces over capacity - k leave no room) or open further bars.
+    Remnants are free, so the bound only applies without them.
+    """
+    if any(s.available is not None for s in stocks):
+        return 0.0
+    capacity = max(s.capacity for s in stocks)
+    sizes = np.asarray(lengths, dtype=np.int64)
+    counts = np.asarray(demands, dtype=np.int64)
+    big = sizes * 2 > capacity
+    bars = 0
+    for k in [0] + sorted(set(sizes[~big].tolist())):
+        alone = big & (sizes > capacity - k)
+        shared = big & ~alone
+        small = ~big & (sizes >= k)
+        room = int(counts[shared].sum()) * capacity - int((sizes * counts)[shared].sum())
+        extra = max(0, -(-(int((sizes * counts)[small].sum()) - room) // capacity))
+        bars = max(bars, int(counts[big].sum()) + extra)
+    return bars * min(s.cost for s in stocks)
 
-    model = cp_model.CpModel()
 
-    x = {}
-    for i in range(num_items):
-        for j in range(num_bins):
-            x[i, j] = model.NewBoolVar(f'x_{i}_{j}')
-    y = [model.NewBoolVar(f'y_{j}') for j in range(num_bins)]
+def _lower_bound(lengths: List[int], demands: List[int], stocks: List[Stock]) -> float:
+    """Cheapest bound that needs no LP: the better of the length bound and L2, rounded up for integer costs."""
+    bound = max(_trivial_bound(lengths, demands, stocks), _l2_bound(lengths, demands, stocks))
+    if all(float(s.cost).is_integer() for s in stocks):
+        bound = math.ceil(bound - 1e-6)
+    return bound
 
-    for i in range(num_items):
-        model.Add(sum(x[i, j] for j in range(num_bins)) == 1)
 
-    for j in range(num_bins):
-        model.Add(
-            sum(x[i, j] * int_lengths[i] for i in range(num_items)) <= int_bar_length
-        )
-        for i in range(num_items):
-            model.AddImplication(x[i, j], y[j])
+def _group_demand(sizes, quantities, mtgs, capacity: int, kerf: float = 0.0):
+    """Collapse parts into distinct lengths (plus kerf) with demand counts instead of expanding every unit.
+
+    Each queue entry is [part, remaining qty]; one part tuple is shared by every unit cut from it.
+    """
+    qty = np.asarray(quantities, dtype=np.int64)
+    lengths_in = np.array([size for size, _, _ in sizes], dtype=np.float64) + kerf
+    units = np.ceil(np.round(lengths_in * SCALE, 6)).astype(np.int64)
+    fits = (qty > 0) & (units > 0) & (units <= capacity)
+    oversize = (qty > 0) & ~fits
+
+    queues = defaultdict(list)
+    for i in np.flatnonzero(fits).tolist():
+        size, name, part_no = sizes[i]
+        queues[int(units[i])].append([(size, mtgs[i], name, part_no), int(qty[i])])
+    unplaced = [((sizes[i][0], mtgs[i], sizes[i][1], sizes[i][2]), int(qty[i])) for i in np.flatnonzero(oversize).tolist()]
+
+    distinct, inverse = np.unique(units[fits], return_inverse=True)
+    totals = np.bincount(inverse, weights=qty[fits], minlength=len(distinct)).astype(np.int64)
+    lengths = distinct[::-1].tolist()
+    demands = totals[::-1].tolist()
+    return lengths, demands, queues, unplaced
+
+
+def _best_fit_decreasing(lengths: List[int], demands: List[int], stocks: List[Stock]) -> Dict[Column, int]:
+    """Best-Fit Decreasing over bars of mixed sizes, kept in a bisect-sorted list of (remaining, bar) - O(n log n).
+
+    Limited stock (remnants) starts out open, so each piece goes to the smallest remnant or open bar
+    it fits; a fresh bar of the cheapest stock per unit length is opened only when nothing fits.
+    Fresh bars are then swapped for the cheapest stock length that still holds their cuts.
+    """
+    fresh = sorted((s for s in range(len(stocks)) if stocks[s].available is None), key=lambda s: (stocks[s].cost / stocks[s].capacity, -stocks[s].capacity))
+    bars = []  # [stock index, pieces per length, used units]
+    open_bars = []  # sorted (remaining units, bar index)
+    for s, stock in enumerate(stocks):
+        for _ in range(stock.available or 0):
+            open_bars.append((stock.capacity, len(bars)))
+            bars.append([s, [0] * len(lengths), 0])
+    open_bars.sort()
+
+    for i, length in enumerate(lengths):
+        for _ in range(demands[i]):
+            k = bisect.bisect_left(open_bars, (length, -1))
+            if k < len(open_bars):
+                remaining, b = open_bars.pop(k)
+            else:
+                s = next(s for s in fresh if stocks[s].capacity >= length)
+                remaining, b = stocks[s].capacity, len(bars)
+                bars.append([s, [0] * len(lengths), 0])
+            bars[b][1][i] += 1
+            bars[b][2] += length
+            if remaining - length > 0:
+                bisect.insort(open_bars, (remaining - length, b))
+
+    columns = defaultdict(int)
+    for s, pieces, used in bars:
+        if not used:
+            continue  # untouched remnant stays in inventory
+        if stocks[s].available is None:
+            s = min((f for f in fresh if stocks[f].capacity >= used), key=lambda f: (stocks[f].cost, stocks[f].capacity))
+        columns[(s, tuple(pieces))] += 1
+    return columns
+
+
+def _best_pattern(lengths: List[int], values: List[float], bounds: List[int], capacity: int) -> Tuple[np.ndarray, list]:
+    """Bounded knapsack by dynamic programming over capacity (binary-split copies, vectorised with numpy).
+
+    Returns the best value for every capacity up to `capacity` and the stages needed by _backtrack.
+    """
+    dp = np.zeros(capacity + 1)
+    stages = []
+    for i, (length, value, bound) in enumerate(zip(lengths, values, bounds)):
+        if value <= 1e-12:
+            continue
+        chunk = 1
+        while bound > 0:
+            take = min(chunk, bound)
+            bound -= take
+            chunk *= 2
+            weight = take * length
+            if weight > capacity:
+                break
+            candidate = dp[:-weight] + take * value
+            better = candidate > dp[weight:] + 1e-12
+            np.maximum(dp[weight:], candidate, out=dp[weight:])
+            stages.append((i, take, weight, better))
+    return dp, stages
+
+
+def _backtrack(stages: list, size: int, capacity: int) -> Tuple[int, ...]:
+    """Recover the knapsack pattern behind dp[capacity]."""
+    pattern = [0] * size
+    c = capacity
+    for i, take, weight, better in reversed(stages):
+        if c >= weight and better[c - weight]:
+            pattern[i] += take
+            c -= weight
+    return tuple(pattern)
+
+
+def _column_generation(lengths: List[int], demands: List[int], stocks: List[Stock], columns: List[Column], deadline: float, integral: bool):
+    """Solve the cutting-stock LP relaxation, adding improving patterns until none price out.
+
+    Returns (lp_bound, lp_values) where lp_bound is a valid lower bound on the plan cost (the LP
+    optimum once converged, otherwise a Lagrangian/Farley bound) and lp_values are column activities.
+    """
+    from ortools.linear_solver import pywraplp  # deferred: OR-Tools takes most of this module's import time
+    solver = pywraplp.Solver.CreateSolver("GLOP")
+    rows = [solver.Constraint(d, solver.infinity()) for d in demands]
+    limits = {s: solver.Constraint(0, stock.available) for s, stock in enumerate(stocks) if stock.available is not None}
+    objective = solver.Objective()
+    objective.SetMinimization()
+    variables = []
+
+    def add_column(column):
+        s, pattern = column
+        var = solver.NumVar(0, solver.infinity(), "")
+        objective.SetCoefficient(var, stocks[s].cost)
+        for i, count in enumerate(pattern):
+            if count:
+                rows[i].SetCoefficient(var, count)
+        if s in limits:
+            limits[s].SetCoefficient(var, 1)
+        variables.append(var)
+
+    for column in columns:
+        add_column(column)
+    max_capacity = max(stock.capacity for stock in stocks)
+    bounds = [min(d, max_capacity // l) for l, d in zip(lengths, demands)]
+    known = set(columns)
+    lp_bound = 0.0
+
+    def bound_at(duals, dp):
+        # Scale the duals until every fresh-stock pattern prices out; limited stock adds its worst reduced cost.
+        theta = min([1.0] + [stocks[s].cost / dp[stocks[s].capacity] for s in range(len(stocks)) if stocks[s].available is None and dp[stocks[s].capacity] > 1e-12])
+        bound = theta * sum(d * pi for d, pi in zip(demands, duals))
+        for s in limits:
+            bound += stocks[s].available * min(0.0, stocks[s].cost - theta * dp[stocks[s].capacity])
+        return bound
+
+    center = None  # Wentges smoothing: price at a mix of the best-bound duals and the LP duals
+    while True:
+        if solver.Solve() != pywraplp.Solver.OPTIMAL:
+            break
+        z = objective.Value()
+        duals = [max(row.dual_value(), 0.0) for row in rows]
+        limit_duals = {s: min(row.dual_value(), 0.0) for s, row in limits.items()}
+        smoothed = duals if center is None else [0.5 * c + 0.5 * d for c, d in zip(center, duals)]
+        while True:
+            dp, stages = _best_pattern(lengths, smoothed, bounds, max_capacity)
+            bound = bound_at(smoothed, dp)
+            if bound > lp_bound:
+                lp_bound, center = bound, smoothed
+            improving = []
+            for s, stock in enumerate(stocks):
+                pattern = _backtrack(stages, len(lengths), stock.capacity)
+                value = sum(a * pi for a, pi in zip(pattern, duals)) + limit_duals.get(s, 0.0)
+                if value > stock.cost + 1e-9 and (s, pattern) not in known:
+                    improving.append((s, pattern))
+            if improving or smoothed is duals:
+                break
+            smoothed = duals  # mispricing: retry with the plain LP duals
+        if not improving:
+            if smoothed is duals:
+                lp_bound = max(lp_bound, z)
+            break
+        if time.time() > deadline:
+            break
+        # Stop on tailing-off once the rounded-up bound can no longer improve.
+        if integral and math.ceil(lp_bound - 1e-6) >= math.ceil(z - 1e-6):
+            break
+        for column in improving:
+            known.add(column)
+            columns.append(column)
+            add_column(column)
+
+    return lp_bound, [var.solution_value() for var in variables]
+
+
+def _solve_pattern_ilp(columns: List[Column], demands: List[int], stocks: List[Stock], available: Dict[int, int], lower_bound: float, hint: List[int], time_limit: float,
+                       gap: float = 0.0, threads: int = SOLVER_THREADS) -> Optional[List[int]]:
+    """Integer master problem: how many bars to cut with each generated pattern, stopping within `gap` cost of the bound.
+
+    The hint is a feasible plan, so its cost caps the objective and how many bars of each paid pattern can be worth using.
+    """
+    from ortools.sat.python import cp_model
+    model = cp_model.CpModel()
+    ceiling = _plan_cost(columns, hint, stocks)
+    uppers = []
+    for s, pattern in columns:
+        upper = max(math.ceil(d / a) for a, d in zip(pattern, demands) if a)
+        if stocks[s].cost > 0:
+            upper = min(upper, math.floor(ceiling / stocks[s].cost + 1e-9))
+        uppers.append(min(upper, available[s]) if s in available else upper)
+    counts = [model.NewIntVar(0, upper, "") for upper in uppers]
+    for i, demand in enumerate(demands):
+        model.Add(sum(p[i] * x for (_, p), x in zip(columns, counts) if p[i]) >= demand)
+    for s, limit in available.items():
+        used = [x for (c, _), x in zip(columns, counts) if c == s]
+        if used:
+            model.Add(sum(used) <= limit)
+    total = sum(round(stocks[s].cost * COST_SCALE) * x for (s, _), x in zip(columns, counts))
+    model.Add(total >= math.ceil(lower_bound * COST_SCALE - 1e-6))
+    model.Add(total <= round(ceiling * COST_SCALE))
+    model.Minimize(total)
+    for x, h, upper in zip(counts, hint, uppers):
+        model.AddHint(x, min(h, upper))
 
-    model.Minimize(sum(y))
     solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = 30.0
+    solver.parameters.max_time_in_seconds = max(time_limit, 0.1)
+    solver.parameters.num_workers = threads
+    solver.parameters.absolute_gap_limit = gap * COST_SCALE
     status = solver.Solve(model)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None
+    return [solver.Value(x) for x in counts]
 
-    bins = [[] for _ in range(num_bins)]
-    if status in [cp_model.OPTIMAL, cp_model.FEASIBLE]:
-        for i in range(num_items):
-            for j in range(num_bins):
-                if solver.Value(x[i, j]):
-                    bins[j].append(full_parts[i])
-        bins = [(b, sum(x[0] for x in b)) for b in bins if b]
-    else:
-        print("❌ No feasible solution found.")
-        bins = []
 
-    return bins
+def _assign_parts(columns: List[Column], counts: List[int], lengths: List[int], queues, stocks: List[Stock]) -> Tuple[List[Bar], List[int]]:
+    """Turn column counts back into bars of concrete parts, dropping any over-produced pieces.
 
-def optimize_by_material(part_data: List[Dict], master_length: float = 144.0) -> Dict[str, List[Tuple[List[Tuple[float, str, str, str]], float]]]:
-    grouped = defaultdict(lambda: {'sizes': [], 'quantities': [], 'mtgs': []})
-    all_cut_plans = {}
+    Returns the bars and the stock index each one is cut from.
+    """
+    bars = []
+    sources = []
+    order = sorted(range(len(columns)), key=lambda c: (stocks[columns[c][0]].available is None, -sum(a * l for a, l in zip(columns[c][1], lengths))))
+    for c in order:
+        s, pattern = columns[c]
+        for _ in range(counts[c]):
+            cuts = []
+            for i, count in enumerate(pattern):
+                queue = queues[lengths[i]]
+                for _ in range(count):
+                    if not queue:
+                        break
+                    entry = queue[0]
+                    cuts.append(entry[0])
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        queue.pop(0)
+            if cuts:
+                bars.append((cuts, sum(c[0] for c in cuts)))
+                sources.append(s)
+    return bars, sources
 
-    for part in part_data:
-        try:
-            size = float(part.get("size", 0))
-            qty = int(part.get("unit_qty", 0))
-            mtg = part.get("mtg_no", "UNKNOWN").strip()
-            name = part.get("part_name", "")
-            number = str(part.get("part_no", ""))
-            material = part.get("material", "Unknown").strip().upper()
-            grouped[material]['sizes'].append((size, name, number))
-            grouped[material]['quantities'].append(qty)
-            grouped[material]['mtgs'].append(mtg)
-        except (ValueError, TypeError):
+
+def _plan_cost(columns: List[Column], counts: List[int], stocks: List[Stock]) -> float:
+    return sum(stocks[s].cost * n for (s, _), n in zip(columns, counts))
+
+
+def _warm_columns(plan, lengths: List[int], demands: List[int], stocks: List[Stock], kerf: float) -> Dict[Column, int]:
+    """Re-express a previous plan's bars as columns of the current model, then cover any new demand with BFD.
+
+    Bars on stock that is no longer offered and pieces that are no longer needed are dropped.
+    """
+    index = {length: i for i, length in enumerate(lengths)}
+    source = {(stock.length, stock.remnant): s for s, stock in enumerate(stocks)}
+    remaining = list(demands)
+    left = {s: stock.available for s, stock in enumerate(stocks) if stock.available is not None}
+    columns = defaultdict(int)
+    flags = getattr(plan, "from_remnant", None) or [False] * len(plan)
+    for (cuts, _), length, remnant in zip(plan, getattr(plan, "stock_lengths", []), flags):
+        s = source.get((length, remnant))
+        if s is None or left.get(s, 1) <= 0:
             continue
+        pattern = [0] * len(lengths)
+        for cut in cuts:
+            i = index.get(_to_units(cut[0] + kerf))
+            if i is not None and remaining[i] > 0:
+                pattern[i] += 1
+                remaining[i] -= 1
+        if any(pattern) and sum(a * l for a, l in zip(pattern, lengths)) <= stocks[s].capacity:
+            columns[(s, tuple(pattern))] += 1
+            if s in left:
+                left[s] -= 1
+        else:
+            for i, a in enumerate(pattern):
+                remaining[i] += a
+    residual_stocks = [stock._replace(available=left.get(s)) for s, stock in enumerate(stocks)]
+    for column, count in _best_fit_decreasing(lengths, remaining, residual_stocks).items():
+        columns[column] += count
+    return columns
 
-    for material, data in grouped.items():
-        print(f"\n=== Material: {material} ===")
-        plans = optimize_cut_plan(data['sizes'], data['quantities'], data['mtgs'], master_length)
-        all_cut_plans[material] = plans
 
+def _covers(columns: List[Column], counts: List[int], demands: List[int]) -> bool:
+    produced = [0] * len(demands)
+    for (_, pattern), count in zip(columns, counts):
+        for i, a in enumerate(pattern):
+            produced[i] += a * count
+    return all(p >= d for p, d in zip(produced, demands))
+
+
+def _solve_exact(lengths: List[int], demands: List[int], stocks: List[Stock], time_limit: float, warm: Optional[Dict[Column, int]] = None,
+                 threads: int = SOLVER_THREADS) -> Tuple[List[Column], List[int], float]:
+    """Pattern-based cutting-stock solve: column generation on the LP relaxation, then an integer master over the generated patterns.
+
+    warm is a previous plan mapped onto this model; its patterns seed the pool and it is the incumbent when it beats greedy.
+    """
+    start = time.time()
+    integral = all(float(stock.cost).is_integer() for stock in stocks)
+
+    # 1. Greedy (or previous) plan: an upper bound and the starting pattern pool
+    greedy = _best_fit_decreasing(lengths, demands, stocks)
+    incumbent = greedy
+    if warm and _plan_cost(list(warm), list(warm.values()), stocks) < _plan_cost(list(greedy), list(greedy.values()), stocks):
+        incumbent = warm
+    # Greedy often meets L2 already; then there is nothing left to prove.
+    quick_bound = _lower_bound(lengths, demands, stocks)
+    if _plan_cost(list(incumbent), list(incumbent.values()), stocks) <= quick_bound + 1e-6:
+        return list(incumbent), list(incumbent.values()), quick_bound
+
+    columns = list(greedy) + [c for c in (warm or {}) if c not in greedy]
+    for s, stock in enumerate(stocks):
+        for i, length in enumerate(lengths):
+            homogeneous = [0] * len(lengths)
+            homogeneous[i] = min(demands[i], stock.capacity // length)
+            if homogeneous[i] and (s, tuple(homogeneous)) not in greedy and (s, tuple(homogeneous)) not in (warm or {}):
+                columns.append((s, tuple(homogeneous)))
+
+    # 2. Column generation for the LP bound and better patterns
+    lp_bound, lp_values = _column_generation(lengths, demands, stocks, columns, start + time_limit / 2, integral)
+    lower_bound = max(lp_bound, quick_bound)
+    if integral:
+        lower_bound = math.ceil(lower_bound - 1e-6)
+
+    # 3. Round the LP down, then cover the small residual demand with an integer master
+    best = [incumbent.get(c, 0) for c in columns]
+    if _plan_cost(columns, best, stocks) > lower_bound + 1e-6:
+        base = [math.floor(v + 1e-9) for v in lp_values]
+        residual = list(demands)
+        available = {s: stock.available for s, stock in enumerate(stocks) if stock.available is not None}
+        for (s, pattern), count in zip(columns, base):
+            for i, a in enumerate(pattern):
+                residual[i] -= a * count
+            if s in available:
+                available[s] -= count
+        residual = [max(r, 0) for r in residual]
+        residual_stocks = [stock._replace(available=available.get(s)) for s, stock in enumerate(stocks)]
+        residual_greedy = _best_fit_decreasing(lengths, residual, residual_stocks)
+        known = set(columns)
+        columns.extend(c for c in residual_greedy if c not in known)
+        base += [0] * (len(columns) - len(base))
+        hint = [residual_greedy.get(c, 0) for c in columns]
+        if warm:
+            # Hint CP-SAT with what the previous plan adds on top of the rounded LP, when that still covers the residual.
+            carried = [max(incumbent.get(c, 0) - b, 0) for c, b in zip(columns, base)]
+            if _covers(columns, carried, residual) and _plan_cost(columns, carried, stocks) <= _plan_cost(columns, hint, stocks):
+                hint = carried
+        residual_bound = lower_bound - _plan_cost(columns, base, stocks)
+        # Mixed stock lengths rarely close the LP gap, so accept anything less than one cheapest bar away from the bound.
+        gap = 0.999 * min(stock.cost for stock in stocks if stock.available is None)
+        counts = _solve_pattern_ilp(columns, residual, stocks, available, residual_bound, hint, time_limit - (time.time() - start), gap, threads) or hint
+        rounded = [b + c for b, c in zip(base, counts)]
+        if _plan_cost(columns, rounded, stocks) < _plan_cost(columns, best, stocks) - 1e-9:
+            best = rounded
+
+    return columns, best + [0] * (len(columns) - len(best)), lower_bound
+
+
+def choose_strategy(num_cuts: int, time_limit: float, distinct: int = 0, capacity: int = 0) -> str:
+    """Pick the engine for strategy="auto" from the expanded cut count, the time budget and the size of the pattern model.
+
+    The exact solver's cost grows with the distinct lengths times the bar capacity in solver units (each pricing round
+    is a knapsack over them), so a group of many different lengths goes greedy even when its cut count is modest.
+    """
+    if num_cuts >= AUTO_GREEDY_MIN_CUTS or time_limit <= AUTO_GREEDY_MAX_TIME or distinct * capacity >= AUTO_GREEDY_MIN_WORK:
+        return "greedy"
+    return "exact"
+
+
+def optimize_cut_plan( sizes: List[Tuple[float, str, str]], quantities: List[int], mtgs: List[str], master_length: float, time_limit: float = 30.0, strategy: str = "auto",
+                      remnants: Optional[List[Tuple[float, int]]] = None, stock: Optional[List[Tuple[float, float]]] = None, kerf: float = 0.0, trim: float = 0.0,
+                      warm_start: Optional["CutPlan"] = None, threads: int = SOLVER_THREADS) -> List[Tuple[List[Tuple[float, str, str, str]], float]]:
+    """Pack parts onto stock bars with the "exact" pattern solver, the "greedy" BFD engine, or "auto" to choose per call.
+
+    stock is the catalog of bar lengths as (length, cost per bar), defaulting to master_length at cost 1, and the
+    objective is the total cost. remnants is an inventory of existing offcuts as (length, count); they are free and
+    filled before new bars are opened. kerf is lost at every cut and trim once per bar. warm_start is an earlier
+    plan for the same material whose bars seed the solver after a small change in demand. threads caps the CP-SAT
+    workers, so solves running side by side share the cores instead of oversubscribing them.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected one of {STRATEGIES}")
+    start = time.time()
+    stocks = _build_stocks(stock or [(master_length, 1.0)], remnants, kerf, trim)
+    lengths, demands, queues, unplaced = _group_demand(sizes, quantities, mtgs, max(s.capacity for s in stocks if s.available is None), kerf)
+    if unplaced:
+        longest = max(s.length for s in stocks if s.available is None)
+        print(f"❌ {sum(qty for _, qty in unplaced)} cut(s) longer than the {longest}\" bar were left out of the plan.")
+    if strategy == "auto":
+        strategy = choose_strategy(sum(demands), time_limit, len(lengths), max((s.capacity for s in stocks), default=0))
+    if not lengths:
+        return CutPlan(status="INCOMPLETE" if unplaced else "OPTIMAL", unplaced=unplaced, strategy=strategy, kerf=kerf, trim=trim)
+
+    warm = _warm_columns(warm_start, lengths, demands, stocks, kerf) if warm_start else None
+    if strategy == "greedy":
+        greedy = _best_fit_decreasing(lengths, demands, stocks)
+        if warm and _plan_cost(list(warm), list(warm.values()), stocks) < _plan_cost(list(greedy), list(greedy.values()), stocks):
+            greedy = warm
+        columns, counts = list(greedy), list(greedy.values())
+        lower_bound = _lower_bound(lengths, demands, stocks)
+    else:
+        columns, counts, lower_bound = _solve_exact(lengths, demands, stocks, time_limit, warm, threads)
+
+    cost = _plan_cost(columns, counts, stocks)
+    bars, sources = _assign_parts(columns, counts, lengths, queues, stocks)
+    status = "INCOMPLETE" if unplaced else "OPTIMAL" if cost <= lower_bound + 1e-6 else "FEASIBLE"
+    return CutPlan(bars, lower_bound=lower_bound, status=status, solve_time=time.time() - start, unplaced=unplaced, strategy=strategy,
+                   stock_lengths=[stocks[s].length for s in sources], from_remnant=[stocks[s].remnant for s in sources], cost=cost, kerf=kerf, trim=trim)
+
+
+def print_cut_plans(all_cut_plans: Dict[str, List[Tuple[List[Tuple[float, str, str, str]], float]]], master_length: float = 144.0):
+    """Print every material's bars as a table, once all groups have been solved."""
+    for material, plans in all_cut_plans.items():
+        print(f"\n=== Material: {material} ===")
         for i, (cuts, used_length) in enumerate(plans, start=1):
-            sequence = [[f"Bar {i}", f"Cut {j+1}", cut[0], cut[3], cut[2], cut[1], master_length - used_length if j == 0 else ""] for j, cut in enumerate(cuts)]
+            length = stock_length_of(plans, i - 1, master_length)
+            label = f"Bar {i} (remnant {length}\")" if _is_remnant(plans, i - 1) else f"Bar {i} ({length}\")"
+            remaining = offcut_of(plans, i - 1, master_length)
+            sequence = [[label, f"Cut {j+1}", cut[0], cut[3], cut[2], cut[1], remaining if j == 0 else ""] for j, cut in enumerate(cuts)]
             print(tabulate(sequence, headers=["Bar #", "Cut #", "Length (in)", "Part No.", "Part Name", "MTG #", "Remaining Offcut"], tablefmt="fancy_grid"))
-        print(f"\nTotal Bars Used: {len(plans)}")
+        reused = sum(getattr(plans, "from_remnant", []))
+        print(f"\nTotal Bars Used: {len(plans) - reused} new + {reused} remnant(s), cost {plans.cost:g} (lower bound {plans.lower_bound:g}, gap {plans.gap:.1%}, {plans.status}, {plans.strategy}, {plans.solve_time:.2f}s)")
+
+def material_of(part: Dict) -> str:
+    """Material group a part is optimized in (the same key PartTable groups by)."""
+    return str(part.get("material") or "Unknown").strip().upper()
+
+def rejected_parts(table: PartTable) -> List[Dict]:
+    """Rows the solver could not read (bad size or quantity), one row per part for the "Rejected Items" extras."""
+    return [{"material": str(part.get("material") or ""), "part_no": part.get("part_no", ""), "part_name": part.get("part_name", ""),
+             "size": part.get("size", ""), "unit_qty": part.get("unit_qty", ""), "mtg_no": part.get("mtg_no", ""), "reason": reason}
+            for _, part, reason in table.rejected]
+
+
+def optimize_by_material(part_data, master_length: float = 144.0, strategy: str = "auto", time_limit: float = 30.0, max_workers: Optional[int] = None, verbose: bool = True,
+                         remnants: Optional[Dict[str, List[Tuple[float, int]]]] = None, catalog: Optional[Dict[str, List[Tuple[float, float]]]] = None,
+                         kerf: float = 0.0, trim: float = 0.0, warm_starts: Optional[Dict[str, CutPlan]] = None, pool: Optional[Executor] = None,
+                         on_solved: Optional[Callable[[str, CutPlan], None]] = None) -> Dict[str, List[Tuple[List[Tuple[float, str, str, str]], float]]]:
+    """Group parts by material and solve each group, in parallel across a process pool when worthwhile.
+
+    time_limit is the budget per material group; max_workers defaults to the CPU count (1 disables the pool).
+    remnants maps material to its offcut inventory as (length, count) pairs, used before fresh bars.
+    catalog maps material to the stock lengths on offer as (length, cost per bar); a "*" entry applies to
+    every other material, and without one master_length at cost 1 is used. warm_starts maps material to an
+    earlier plan used to seed its solve. part_data is a list of extraction dicts or a PartTable.
+    pool is a long-lived executor to solve in (its workers stay warm); by default one is spawned per call.
+    on_solved(material, plan) is called as each material's plan comes back.
+    """
+    table = part_data if isinstance(part_data, PartTable) else PartTable.from_records(part_data)
+    groups = table.groups()
+    all_cut_plans = {}
+    for index, part, reason in table.rejected:
+        print(f"⚠️ Skipped row {index + 1} (part {part.get('part_no', '?')}, {part.get('material', '?')}): {reason}")
+
+    stock = {material.strip().upper(): pieces for material, pieces in (remnants or {}).items()}
+    lengths = {material.strip().upper(): bars for material, bars in (catalog or {}).items()}
+    jobs = {}
+    for material, rows in groups.items():
+        sizes, quantities, mtgs = table.solver_inputs(rows)
+        jobs[material] = dict(sizes=sizes, quantities=quantities, mtgs=mtgs, master_length=master_length, time_limit=time_limit, strategy=strategy,
+                              remnants=stock.get(material), stock=lengths.get(material, lengths.get("*")), kerf=kerf, trim=trim,
+                              warm_start=(warm_starts or {}).get(material))
+    workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    total_cuts = table.total_cuts()
+
+    parallel = workers > 1 and total_cuts >= PARALLEL_MIN_CUTS
+    # Each group's time_limit is wall clock, so concurrent solves split the cores rather than each taking SOLVER_THREADS.
+    threads = max(1, min(SOLVER_THREADS, (os.cpu_count() or 1) // (workers if parallel else 1)))
+    for kwargs in jobs.values():
+        kwargs["threads"] = threads
+    with span("optimize", materials=len(jobs), cuts=total_cuts, workers=workers if parallel else 1):
+        if parallel:
+            # Spawned workers are safe to start from Streamlit's script thread.
+            with nullcontext(pool) if pool else ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {material: executor.submit(optimize_cut_plan, **kwargs) for material, kwargs in jobs.items()}
+                for material in jobs:
+                    all_cut_plans[material] = futures[material].result()
+                    if on_solved:
+                        on_solved(material, all_cut_plans[material])
+        else:
+            for material, kwargs in jobs.items():
+                all_cut_plans[material] = optimize_cut_plan(**kwargs)
+                if on_solved:
+                    on_solved(material, all_cut_plans[material])
+        # Solves may run in worker processes, so each one is recorded from the time it reports.
+        for material, plans in all_cut_plans.items():
+            record("solve", plans.solve_time, material=material, strategy=plans.strategy, status=plans.status, gap=round(plans.gap, 4), bars=len(plans),
+                   cuts=table.total_cuts(groups[material]))
 
+    if verbose:
+        print_cut_plans(all_cut_plans, master_length)
     return all_cut_plans
 
-def save_cut_plan_csv(all_cut_plans: Dict[str, List[Tuple[List[Tuple[float, str, str, str]], float]]], filename: str, extras: Dict[str, List[Dict]] = None):
-    master_length = 144.0
-    with open(filename, mode="w", newline="", encoding="utf-8") as f:
+PLAN_HEADERS = ["Bar #", "Stock (in)", "Cut #", "Length (in)", "Part No.", "Part Name", "MTG #", "Remaining Offcut"]
+
+
+@contextmanager
+def _text_output(target):
+    """Writable text stream for a path, a text buffer, or a binary buffer (wrapped as UTF-8). Buffers are left open."""
+    if isinstance(target, (str, os.PathLike)):
+        with open(target, mode="w", newline="", encoding="utf-8") as f:
+            yield f
+    elif isinstance(target, io.TextIOBase):
+        yield target
+    else:
+        wrapper = io.TextIOWrapper(target, encoding="utf-8", newline="")
+        try:
+            yield wrapper
+        finally:
+            wrapper.flush()
+            wrapper.detach()
+
+
+def plan_rows(plans, index: int, master_length: float) -> List[List]:
+    """Table rows for one bar; stock length and offcut only on its first cut."""
+    cuts, _ = plans[index]
+    stock, offcut = stock_length_of(plans, index, master_length), offcut_of(plans, index, master_length)
+    return [[f"Bar {index + 1}", stock if j == 1 else "", f"Cut {j}", length, part_no, part_name, mtg, offcut if j == 1 else ""]
+            for j, (length, mtg, part_name, part_no) in enumerate(cuts, start=1)]
+
+
+def oversize_parts(all_cut_plans) -> List[Dict]:
+    """Parts left out of the plans because no stock bar is long enough, one row per part for the "Oversize Items" extras."""
+    return [{"material": material, "part_no": part_no, "part_name": name, "size": size, "unit_qty": qty, "mtg_no": mtg}
+            for material, plans in all_cut_plans.items()
+            for (size, mtg, name, part_no), qty in getattr(plans, "unplaced", [])]
+
+
+def save_cut_plan_csv(all_cut_plans: Dict[str, List[Tuple[List[Tuple[float, str, str, str]], float]]], filename, extras: Dict[str, List[Dict]] = None, master_length: float = 144.0):
+    """Write the cut plan as CSV to a path or an open buffer (text or binary, e.g. io.BytesIO for a download)."""
+    with _text_output(filename) as f:
         writer = csv.writer(f)
 
         for material, plans in all_cut_plans.items():
             writer.writerow([f"Material: {material}"])
-            writer.writerow(["Bar #", "Cut #", "Length (in)", "Part No.", "Part Name", "MTG #", "Remaining Offcut"])
-
-            for i, (cuts, used_length) in enumerate(plans, start=1):
-                for j, (length, mtg, part_name, part_no) in enumerate(cuts, start=1):
-                    writer.writerow([
-                        f"Bar {i}",
-                        f"Cut {j}",
-                        length,
-                        part_no,
-                        part_name,
-                        mtg,
-                        master_length - used_length if j == 1 else ""
-                    ])
+            writer.writerow(PLAN_HEADERS)
+
+            for i in range(len(plans)):
+                writer.writerows(plan_rows(plans, i, master_length))
             writer.writerow([])
 
         if extras:
@@ -155,28 +692,35 @@ def save_cut_plan_csv(all_cut_plans: Dict[str, List[Tuple[List[Tuple[float, str,
                         writer.writerow([row.get(h, "") for h in headers])
                 writer.writerow([])
 
-def save_cut_plan_pdf(all_cut_plans, filename, extras=None):
-    c = canvas.Canvas(filename, pagesize=A4)
-    width, height = A4
-    y = height - 40
-    c.setFont("Helvetica", 10)
-
+def save_cut_plan_json(all_cut_plans: Dict[str, List[Tuple[List[Tuple[float, str, str, str]], float]]], filename: str, extras: Dict[str, List[Dict]] = None, master_length: float = 144.0, summary: Dict = None):
+    """Machine-readable cut plan: every bar with its cuts and offcut, solver status per material, plus extras and a run summary"""
+    materials = {}
     for material, plans in all_cut_plans.items():
-        c.drawString(40, y, f"Material: {material}")
-        y -= 15
-        c.drawString(40, y, "Bar # | Cut # | Length (in) | Part No. | Part Name | MTG # | Remaining")
-        y -= 15
-        for i, (cuts, used_length) in enumerate(plans, start=1):
-            for j, (cut, mtg, name, part_no) in enumerate(cuts, start=1):
-                line = f"Bar {i} | Cut {j} | {cut} | {part_no} | {name} | {mtg} | {144 - used_length if j == 1 else ''}"
-                c.drawString(40, y, line)
-                y -= 15
-                if y < 60:
-                    c.showPage()
-                    c.setFont("Helvetica", 10)
-                    y = height - 40
-            y -= 5
-        y -= 20
-
-    c.save()
+        materials[material] = {
+            "lower_bound": getattr(plans, "lower_bound", None),
+            "status": getattr(plans, "status", None),
+            "gap": getattr(plans, "gap", None),
+            "solve_time": getattr(plans, "solve_time", None),
+            "strategy": getattr(plans, "strategy", None),
+            "cost": getattr(plans, "cost", None),
+            "kerf": getattr(plans, "kerf", 0.0),
+            "trim": getattr(plans, "trim", 0.0),
+            "bars": [
+                {
+                    "bar": i,
+                    "stock_length": stock_length_of(plans, i - 1, master_length),
+                    "remnant": _is_remnant(plans, i - 1),
+                    "used": round(used_length, 4),
+                    "remaining": offcut_of(plans, i - 1, master_length),
+                    "cuts": [{"length": length, "part_no": part_no, "part_name": part_name, "mtg": mtg} for length, mtg, part_name, part_no in cuts],
+                }
+                for i, (cuts, used_length) in enumerate(plans, start=1)
+            ],
+        }
+    with open(filename, mode="w", encoding="utf-8") as f:
+        json.dump({"master_length": master_length, "materials": materials, "extras": extras or {}, "summary": summary or {}}, f, indent=2)
 
+def save_cut_plan_pdf(all_cut_plans, filename, extras=None, master_length=144.0):
+    """Cut sheet PDF written to a path or a binary buffer: per-material bar tables with a layout diagram per bar, then the extras."""
+    from cutsheet import write_pdf  # reportlab is only loaded when a PDF is actually written
+    write_pdf(all_cut_plans, filename, extras, master_length)
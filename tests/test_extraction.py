@@ -0,0 +1,50 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from Copper import _validated_extraction
+from preprocess import PreparedPage
+from prompt import set_client
+from schema import RepairBudget
+
+PAGE = PreparedPage("aGVsbG8=", "image/png", 8, None, None, (1, 1))
+VALID = {"table_found": True, "mtg_no": "MTG104233", "parts": [{"part_no": "1", "material": "CU", "size": "12.5", "unit_qty": 2}]}
+
+
+class _Replies:
+    """Stand-in chat client answering with the given contents in order, recording each request."""
+
+    def __init__(self, *contents):
+        self.contents = list(contents)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.contents.pop(0)))], usage=None)
+
+
+@pytest.fixture
+def client():
+    def install(*contents):
+        replies = _Replies(*contents)
+        set_client(replies)
+        return replies
+    yield install
+    set_client(None)
+
+
+def test_non_object_json_is_repaired(client):
+    replies = client('[{"part_no": 1}]', json.dumps(VALID))
+    result = _validated_extraction(PAGE, RepairBudget(2))
+    assert result["repairs"] == 1 and result["problems"] == [] and result["confidence"] == 0.9
+    assert [p["size"] for p in result["parts"]] == ["12.5"]
+    assert any('[{"part_no": 1}]' in str(m["content"]) for m in replies.requests[1]["messages"])
+
+
+def test_non_object_json_without_budget_fails_the_page_only(client):
+    client("[]")
+    result = _validated_extraction(PAGE, RepairBudget(0))
+    assert result["parts"] == [] and result["confidence"] == 0.0
+    assert result["problems"] == ["the response is not a JSON object"]
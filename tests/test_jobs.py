@@ -0,0 +1,72 @@
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import jobs
+from jobs import ClaimLost, JobStore, Workers, run_job
+from session import PlanSession
+
+PARAMS = {"stock": [[144.0, 1.0]], "kerf": 0.0, "trim": 0.0, "inventory": {}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_requeued_claim_cannot_run_or_finish(store):
+    job_id = store.submit("planner", [("a.pdf", b"%PDF")], PARAMS)
+    _, stale = store.claim()
+    assert store.requeue_stale(after=-1) == 1
+    _, current = store.claim()
+
+    session = PlanSession()
+    session.files["kept"] = ([{"part_no": "1"}], [])
+    with pytest.raises(ClaimLost):
+        run_job(store, job_id, session, token=stale)
+    assert "kept" in session.files
+    assert not store.finish(job_id, {"plans": {}}, stale)
+    assert store.files(job_id)  # still there for the current claim
+    assert store.finish(job_id, {"plans": {}}, current)
+    assert store.get(job_id)["status"] == "done" and not store.files(job_id)
+
+
+def test_job_waiting_for_its_planner_keeps_its_claim(store, monkeypatch):
+    monkeypatch.setattr(jobs, "STALE_AFTER", 0.5)
+    ran = []
+    monkeypatch.setattr(jobs, "run_job", lambda store, job_id, session, pool, token: ran.append(job_id) or {"plans": {}})
+    workers = Workers(store, threads=1, poll=0.05)
+    _, lock = workers._session("planner")
+    with lock:  # an earlier job of the same planner is still running
+        job_id = store.submit("planner", [("a.pdf", b"%PDF")], PARAMS)
+        workers.wake()
+        deadline = time.time() + 1.5
+        while time.time() < deadline:
+            assert store.requeue_stale(after=0.3) == 0
+            time.sleep(0.05)
+    deadline = time.time() + 2
+    while store.get(job_id)["status"] != "done" and time.time() < deadline:
+        time.sleep(0.05)
+    assert ran == [job_id] and store.get(job_id)["status"] == "done"
+
+
+def test_broken_solver_pool_is_replaced_and_the_job_retried(store, monkeypatch):
+    pools = [object()]
+    calls = []
+
+    def fake_run_job(store, job_id, session, pool, token):
+        calls.append(pool)
+        if len(calls) == 1:
+            raise BrokenProcessPool("a solver process died")
+        return {"plans": {}}
+
+    monkeypatch.setattr(jobs, "run_job", fake_run_job)
+    workers = Workers(store, threads=1, poll=0.05, pool=lambda: pools[-1], reset_pool=lambda: pools.append(object()))
+    job_id = store.submit("planner", [("a.pdf", b"%PDF")], PARAMS)
+    workers.wake()
+    deadline = time.time() + 2
+    while store.get(job_id)["status"] != "done" and time.time() < deadline:
+        time.sleep(0.05)
+    assert store.get(job_id)["status"] == "done"
+    assert calls == pools and len(pools) == 2
@@ -0,0 +1,44 @@
+import pytest
+from PIL import Image, ImageDraw
+
+from preprocess import find_table_region, prepare_page
+
+TABLE = (300, 1000, 4800, 3160)  # left, top, right, bottom of the drawn grid on a 300-DPI letter sheet
+
+
+def _sheet(rule: int, angle: float, table: bool = True) -> Image.Image:
+    """Synthetic drawing: a ruled parts table, some cell text and a title block, rotated like a skewed scan."""
+    image = Image.new("L", (5100, 6600), 255)
+    draw = ImageDraw.Draw(image)
+    xs = [300, 900, 1500, 2400, 3000, 3600, 4200, 4800]
+    ys = [1000 + 90 * i for i in range(25)]
+    if table:
+        for y in ys:
+            draw.rectangle([xs[0], y, xs[-1], y + rule - 1], fill=0)
+        for x in xs:
+            draw.rectangle([x, ys[0], x + rule - 1, ys[-1] + rule - 1], fill=0)
+        for y in ys[:-1]:
+            for x in xs[:-1]:
+                draw.text((x + 20, y + 30), "PART 123 CU 1/8X3/4", fill=0)
+    for k in range(8):
+        draw.text((3550, 5850 + 70 * k), "TITLE BLOCK TEXT LINE", fill=0)
+    draw.rectangle([3500, 5800, 4900, 6500], outline=0, width=rule)
+    return image.rotate(angle, fillcolor=255, resample=Image.BILINEAR).convert("RGB")
+
+
+@pytest.mark.parametrize("rule", [3, 6])
+@pytest.mark.parametrize("angle", [0.0, 0.2, 1.0, -1.5])
+def test_skewed_table_is_cropped_whole(rule, angle):
+    region = find_table_region(_sheet(rule, angle))
+    assert region is not None
+    left, top, right, bottom = region
+    assert left <= TABLE[0] and right >= TABLE[2]
+    assert top <= TABLE[1] and bottom >= TABLE[3] - 100  # the far corner moves up under counter-clockwise skew
+    assert right - left < 1.2 * (TABLE[2] - TABLE[0]) and bottom - top < 1.5 * (TABLE[3] - TABLE[1])
+
+
+def test_page_without_grid_is_sent_whole():
+    image = _sheet(3, 0.5, table=False)
+    assert find_table_region(image) is None
+    page = prepare_page(image, measure=False)
+    assert page.region is None and page.bytes_sent > 0
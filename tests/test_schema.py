@@ -0,0 +1,14 @@
+from schema import confidence, validate_result
+
+
+def _page(*sizes):
+    return {"table_found": True, "mtg_no": "MTG104233",
+            "parts": [{"part_no": str(k), "material": "CU", "size": size, "unit_qty": 2} for k, size in enumerate(sizes, start=1)]}
+
+
+def test_sizes_must_be_a_single_length():
+    cleaned, problems = validate_result(_page("3'-6\"", "2X 12.5", '100 7/16" LG.', 12.5, "", None))
+    assert [p["size"] for p in cleaned["parts"]] == ["100.4375", "12.5", "", ""]
+    assert [r["row"]["size"] for r in cleaned["rejected"]] == ["3'-6\"", "2X 12.5"]
+    assert len(problems) == 2
+    assert confidence(cleaned) == round(4 / 6, 3)
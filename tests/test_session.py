@@ -0,0 +1,21 @@
+from session import PlanSession
+
+
+def _parts(size):
+    return [{"part_no": "1", "part_name": "BUS", "material": "CU", "size": size, "unit_qty": 2, "mtg_no": "MTG1"},
+            {"part_no": "2", "part_name": "LINK", "material": "AL", "size": "20", "unit_qty": 1, "mtg_no": "MTG1"}]
+
+
+def test_resolves_only_changed_materials():
+    session = PlanSession()
+    first = session.optimize(_parts("10"), verbose=False)
+    assert set(first) == {"CU", "AL"}
+    second = session.optimize(_parts("12"), verbose=False)
+    assert session.last_solved == ["CU"] and second["AL"] is first["AL"]
+
+
+def test_material_with_only_rejected_rows_drops_its_old_plan():
+    session = PlanSession()
+    assert sum(len(cuts) for cuts, _ in session.optimize(_parts("10"), verbose=False)["CU"]) == 2
+    plans = session.optimize(_parts("abc"), verbose=False)
+    assert "CU" not in plans and "AL" in plans
@@ -0,0 +1,133 @@
+import random
+from collections import Counter
+from functools import lru_cache
+
+import pytest
+
+from sorting import SCALE, optimize_cut_plan, oversize_parts
+
+
+def _units(length: float) -> int:
+    return round(length * SCALE)
+
+
+def _instance(rng: random.Random, kinds: int, max_qty: int, master: float):
+    sizes = [(round(rng.uniform(0.1, 0.9) * master, 2), f"part {k}", f"P{k}") for k in range(kinds)]
+    quantities = [rng.randint(1, max_qty) for _ in sizes]
+    return sizes, quantities, [f"MTG-{k % 3}" for k in range(kinds)]
+
+
+def _brute_force(pieces, catalog):
+    """Cheapest cost to cut every piece (integer units) from unlimited bars of catalog [(capacity, cost)], by subset DP."""
+    n = len(pieces)
+    load = [0] * (1 << n)
+    for mask in range(1, 1 << n):
+        low = (mask & -mask).bit_length() - 1
+        load[mask] = load[mask & (mask - 1)] + pieces[low]
+    bar = [min((cost for capacity, cost in catalog if capacity >= load[m]), default=None) for m in range(1 << n)]
+
+    @lru_cache(maxsize=None)
+    def best(mask):
+        if not mask:
+            return 0.0
+        low = mask & -mask
+        rest = mask ^ low
+        result = float("inf")
+        sub = rest
+        while True:  # every bar holding the lowest remaining piece
+            group = sub | low
+            if bar[group] is not None:
+                result = min(result, bar[group] + best(mask ^ group))
+            if not sub:
+                return result
+            sub = (sub - 1) & rest
+
+    return best((1 << n) - 1)
+
+
+def _check_plan(plan, sizes, quantities, catalog, kerf=0.0, trim=0.0, remnants=()):
+    """Every demanded cut placed exactly once and no bar cut past its usable length."""
+    placed = Counter(part_no for cuts, _ in plan for _, _, _, part_no in cuts)
+    assert placed == Counter({part_no: qty for (_, _, part_no), qty in zip(sizes, quantities) if qty > 0})
+    for (cuts, used), stock in zip(plan, plan.stock_lengths):
+        assert sum(_units(length) for length, _, _, _ in cuts) <= _units(used) + 1
+        assert _units(used) + len(cuts) * _units(kerf) <= _units(stock - trim + kerf)
+    used_remnants = Counter(stock for stock, remnant in zip(plan.stock_lengths, plan.from_remnant) if remnant)
+    available = Counter()
+    for length, count in remnants:
+        available[length] += count
+    assert all(used_remnants[length] <= available[length] for length in used_remnants)
+    costs = dict(catalog)
+    assert plan.cost == pytest.approx(sum(costs[s] for s, remnant in zip(plan.stock_lengths, plan.from_remnant) if not remnant))
+    assert plan.lower_bound <= plan.cost + 1e-6
+
+
+@pytest.mark.parametrize("strategy", ["exact", "greedy"])
+def test_matches_brute_force_on_small_instances(strategy):
+    rng = random.Random(2024)
+    for _ in range(100):
+        master = 144.0
+        sizes, quantities, mtgs = _instance(rng, rng.randint(1, 5), 2, master)
+        pieces = [_units(size) for (size, _, _), qty in zip(sizes, quantities) for _ in range(qty)]
+        plan = optimize_cut_plan(sizes, quantities, mtgs, master, time_limit=5, strategy=strategy)
+        _check_plan(plan, sizes, quantities, [(master, 1.0)])
+        optimum = _brute_force(pieces, [(_units(master), 1.0)])
+        assert plan.lower_bound <= optimum + 1e-6
+        assert plan.cost >= optimum - 1e-6
+        if plan.status == "OPTIMAL":
+            assert plan.cost == pytest.approx(optimum)
+        if strategy == "exact":
+            assert plan.cost == pytest.approx(optimum)
+
+
+def test_mixed_catalog_matches_brute_force():
+    rng = random.Random(7)
+    for _ in range(40):
+        catalog = [(96.0, 0.7), (144.0, 1.0)]
+        sizes, quantities, mtgs = _instance(rng, rng.randint(1, 3), 3, 96.0)
+        plan = optimize_cut_plan(sizes, quantities, mtgs, 144.0, time_limit=5, strategy="exact", stock=catalog)
+        _check_plan(plan, sizes, quantities, catalog)
+        pieces = [_units(size) for (size, _, _), qty in zip(sizes, quantities) for _ in range(qty)]
+        optimum = _brute_force(pieces, [(_units(length), cost) for length, cost in catalog])
+        assert plan.lower_bound <= optimum + 1e-6
+        if plan.status == "OPTIMAL":
+            assert plan.cost == pytest.approx(optimum)
+
+
+@pytest.mark.parametrize("strategy", ["exact", "greedy"])
+def test_random_kerf_trim_remnant_catalog_sweep(strategy):
+    rng = random.Random(99)
+    for _ in range(30):
+        catalog = rng.choice([[(144.0, 1.0)], [(120.0, 0.85), (144.0, 1.0)], [(96.0, 0.6), (144.0, 1.0), (240.0, 1.5)]])
+        kerf = rng.choice([0.0, 0.0625, 0.125])
+        trim = rng.choice([0.0, 0.25, 1.0])
+        remnants = [(round(rng.uniform(20, 100), 1), rng.randint(1, 3)) for _ in range(rng.randint(0, 3))]
+        sizes, quantities, mtgs = _instance(rng, rng.randint(1, 12), 8, 100.0)
+        plan = optimize_cut_plan(sizes, quantities, mtgs, 144.0, time_limit=5, strategy=strategy, stock=catalog,
+                                 remnants=remnants, kerf=kerf, trim=trim)
+        _check_plan(plan, sizes, quantities, catalog, kerf, trim, remnants)
+        assert plan.status in ("OPTIMAL", "FEASIBLE")
+
+
+def test_warm_start_covers_new_demand():
+    rng = random.Random(5)
+    sizes, quantities, mtgs = _instance(rng, 12, 6, 144.0)
+    first = optimize_cut_plan(sizes, quantities, mtgs, 144.0, time_limit=5, strategy="exact")
+    changed = list(quantities)
+    changed[0] += 3
+    changed[1] = max(changed[1] - 2, 0)
+    sizes_2 = sizes + [(37.5, "new part", "PNEW")]
+    changed.append(4)
+    second = optimize_cut_plan(sizes_2, changed, mtgs + ["MTG-9"], 144.0, time_limit=5, strategy="exact", warm_start=first)
+    _check_plan(second, sizes_2, changed, [(144.0, 1.0)])
+
+
+def test_oversize_parts_leave_the_plan_incomplete():
+    sizes = [(200.0, "long bus", "L1"), (50.0, "short bar", "S1")]
+    plan = optimize_cut_plan(sizes, [2, 3], ["M1", "M1"], 144.0, strategy="exact")
+    assert plan.status == "INCOMPLETE"
+    assert sum(len(cuts) for cuts, _ in plan) == 3
+    assert oversize_parts({"CU": plan}) == [{"material": "CU", "part_no": "L1", "part_name": "long bus", "size": 200.0, "unit_qty": 2, "mtg_no": "M1"}]
+
+    only = optimize_cut_plan(sizes[:1], [2], ["M1"], 144.0)
+    assert len(only) == 0 and only.status == "INCOMPLETE"
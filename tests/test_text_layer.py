@@ -0,0 +1,56 @@
+import pytest
+
+from text_layer import extract_text_tables, parse_size
+
+pymupdf = pytest.importorskip("pymupdf")
+
+COLUMN_X = {"finish": 40, "part_no": 80, "part_name": 125, "material": 230, "size": 350, "unit_qty": 430, "order_qty": 480, "remarks": 530}
+HEADINGS = [("FINISH", "finish"), ("PART", "part_no"), ("PART NAME", "part_name"), ("MATERIAL", "material"), ("SIZE", "size"),
+            ("UNIT QTY.", "unit_qty"), ("ORDER QTY.", "order_qty"), ("REMARKS", "remarks")]
+
+
+def _write_pdf(path, pages):
+    """A CAD-style drawing per page: title block with the MTG number and a parts table with left-aligned cells."""
+    doc = pymupdf.open()
+    for rows in pages:
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((40, 60), "ASSEMBLY DRAWING MTG 104233", fontsize=10)
+        for text, column in HEADINGS:
+            page.insert_text((COLUMN_X[column], 100), text, fontsize=7)
+        for k, row in enumerate(rows):
+            for column, text in row.items():
+                page.insert_text((COLUMN_X[column], 114 + 12 * k), text, fontsize=7)
+    doc.save(str(path))
+
+
+ROWS = [
+    {"finish": "TIN", "part_no": "1", "part_name": "BUS BAR", "material": "CU 1/4 X 2", "size": "100 7/16\" LG.", "unit_qty": "2", "order_qty": "4"},
+    {"finish": "TIN", "part_no": "2", "part_name": "LINK", "material": "CU 1/4 X 2", "size": "13.19\"", "unit_qty": "3", "order_qty": "6"},
+    {"finish": "", "part_no": "3", "part_name": "BRACKET", "material": "STL", "size": "", "unit_qty": "1", "order_qty": "2", "remarks": "KANBAN"},
+]
+
+
+def test_parses_cad_table(tmp_path):
+    path = tmp_path / "mtg.pdf"
+    _write_pdf(path, [ROWS])
+    result = extract_text_tables(str(path))[1]
+    assert result["mtg_no"] == "MTG104233"
+    assert [(p["part_no"], p["material"], p["size"], p["unit_qty"]) for p in result["parts"]] == [
+        ("1", "CU 1/4 X 2", "100.4375", 2), ("2", "CU 1/4 X 2", "13.19", 3), ("3", "STL", "", 1)]
+    assert result["parts"][2]["remarks"] == "KANBAN"
+
+
+def test_spilled_material_falls_back_to_vision(tmp_path):
+    path = tmp_path / "mtg.pdf"
+    spilled = [dict(ROWS[0], material="1/8 X 3/4 PLATED COPPER CU")] + ROWS[1:]
+    _write_pdf(path, [ROWS, spilled])
+    assert list(extract_text_tables(str(path))) == [1]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('13.19" LG.', "13.19"), ("12 3/8 LG", "12.375"), ("100 7/16", "100.4375"), ('143 15/16"', "143.9375"),
+    ("12-1/2 IN", "12.5"), ("3/8", "0.375"), ("144", "144"), ("", ""),
+    ("3'-6\"", None), ("2X 12.5", None), ("CU 100 7/16", None), ("12 1/0", None),
+])
+def test_parse_size_reads_whole_cell(text, expected):
+    assert parse_size(text) == expected
@@ -0,0 +1,194 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+COLUMNS = ["finish", "part_no", "part_name", "material", "size", "unit_qty", "order_qty", "remarks"]
+LINE_TOLERANCE = 3.0  # points; words whose vertical centres are this close share a line
+MTG_PATTERN = re.compile(r"\bMTG[\s#:.\-]*(\d{4,})\b", re.IGNORECASE)
+# The whole SIZE cell: a length in inches (decimal, fraction or mixed number), optionally marked " / IN / LG.
+SIZE_PATTERN = re.compile(r'\s*(?:(\d+)\s*/\s*(\d+)|(\d*\.\d+|\d+)(?:\s*-?\s*(\d+)\s*/\s*(\d+))?)(?:\s*(?:"|\'\'|IN\b\.?|INCH(?:ES)?\b|LG\b\.?|LONG\b))*\s*',
+                          re.IGNORECASE)
+
+Word = Tuple[float, float, float, float, str]
+
+
+def _pymupdf():
+    """PyMuPDF module, imported on first use (it is slow to load), or None when not installed."""
+    try:
+        import pymupdf
+    except ImportError:  # older PyMuPDF only ships the fitz name
+        try:
+            import fitz as pymupdf
+        except ImportError:
+            pymupdf = None
+    return pymupdf
+
+
+def _lines(words: List[Word]) -> List[List[Word]]:
+    """Group words into text lines by vertical centre, each sorted left to right."""
+    lines = []
+    for word in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        centre = (word[1] + word[3]) / 2
+        if lines and abs(centre - lines[-1][0]) <= LINE_TOLERANCE:
+            lines[-1][1].append(word)
+        else:
+            lines.append([centre, [word]])
+    return [sorted(line, key=lambda w: w[0]) for _, line in lines]
+
+
+def _header_columns(lines: List[List[Word]]) -> Optional[Tuple[int, List[float]]]:
+    """Find the FINISH | PART | PART NAME | MATERIAL | SIZE | UNIT QTY | ORDER QTY | REMARKS header.
+
+    Returns the index of the header line and the x centre of each column heading.
+    """
+    for index, line in enumerate(lines):
+        texts = [w[4].upper().rstrip(".:") for w in line]
+        if not {"FINISH", "MATERIAL", "SIZE", "REMARKS"} <= set(texts):
+            continue
+        # UNIT/ORDER QTY. may be stacked on two lines; look at the neighbours too.
+        band = [w for l in lines[max(0, index - 1):index + 2] for w in l]
+        anchors = {}
+        for k, word in enumerate(line):
+            text = texts[k]
+            following = texts[k + 1] if k + 1 < len(texts) else ""
+            if text == "PART" and following == "NAME":
+                anchors["part_name"] = (word[0] + line[k + 1][2]) / 2
+            elif text == "PART" and "part_no" not in anchors:
+                anchors["part_no"] = (word[0] + word[2]) / 2
+            elif text in ("FINISH", "MATERIAL", "SIZE", "REMARKS"):
+                anchors[{"FINISH": "finish", "MATERIAL": "material", "SIZE": "size", "REMARKS": "remarks"}[text]] = (word[0] + word[2]) / 2
+        for word in band:
+            text = word[4].upper().rstrip(".:")
+            if text in ("UNIT", "ORDER"):
+                anchors[text.lower() + "_qty"] = (word[0] + word[2]) / 2
+        if len(anchors) == len(COLUMNS):
+            centres = [anchors[c] for c in COLUMNS]
+            if centres == sorted(centres):
+                stacked = index + 1 < len(lines) and any(w[4].upper().rstrip(".:") == "QTY" for w in lines[index + 1])
+                return index + 1 if stacked else index, centres
+    return None
+
+
+def _column_of(x: float, bounds: List[float]) -> int:
+    for k, bound in enumerate(bounds):
+        if x < bound:
+            return k
+    return len(bounds)
+
+
+def parse_size(text: str) -> Optional[str]:
+    """Read the length in inches from a SIZE cell, e.g. '13.19" LG.' -> '13.19', '100 7/16 LG' -> '100.4375'.
+
+    A blank cell gives "" (a non-cuttable part). Anything else that is not just a length, such as 3'-6" or
+    2X 12.5 or a word spilled over from the MATERIAL column, gives None.
+    """
+    if not text.strip():
+        return ""
+    match = SIZE_PATTERN.fullmatch(text)
+    if not match:
+        return None
+    bare_num, bare_den, whole, num, den = match.groups()
+    if (bare_den or den) and int(bare_den or den) == 0:
+        return None
+    if not (num or bare_num):
+        return whole
+    value = int(bare_num) / int(bare_den) if bare_num else float(whole) + int(num) / int(den)
+    return f"{round(value, 4):.4f}".rstrip("0").rstrip(".")
+
+
+def parse_page_words(words: List[Word]) -> Optional[Dict]:
+    """Parse the parts table from one page's words into the extractor's JSON schema, or None if absent/unparseable."""
+    lines = _lines(words)
+    header = _header_columns(lines)
+    if header is None:
+        return None
+    header_index, centres = header
+    bounds = [(a + b) / 2 for a, b in zip(centres, centres[1:])]
+    left_edge = centres[0] - (bounds[0] - centres[0]) * 1.5
+    right_edge = centres[-1] + (centres[-1] - bounds[-1]) * 3
+
+    rows = []
+    last_bottom = max(w[3] for w in lines[header_index])
+    for line in lines[header_index + 1:]:
+        cells = [w for w in line if left_edge <= (w[0] + w[2]) / 2 <= right_edge]
+        if not cells:
+            break
+        top = min(w[1] for w in cells)
+        columns = [[] for _ in COLUMNS]
+        for word in cells:
+            columns[_column_of((word[0] + word[2]) / 2, bounds)].append(word[4])
+        text = [" ".join(c) for c in columns]
+        if re.fullmatch(r"\d+[A-Z]?", text[1]):
+            rows.append(text)
+        elif rows and top - last_bottom <= 0.5 * (cells[0][3] - cells[0][1]):
+            # wrapped cell text sits tight under the previous line and continues its row
+            rows[-1] = [f"{a} {b}".strip() for a, b in zip(rows[-1], text)]
+        else:
+            break
+        last_bottom = max(w[3] for w in cells)
+
+    if not rows:
+        return None
+    parts = []
+    for row in rows:
+        cell = dict(zip(COLUMNS, row))
+        try:
+            unit_qty = int(cell["unit_qty"].split()[0])
+        except (ValueError, IndexError):
+            return None  # not confident: let the vision model read this page
+        # Columns split halfway between headings, so a left-aligned MATERIAL longer than its heading spills its
+        # last words into SIZE. parse_size rejects such a cell and the page goes to the vision model instead.
+        size = parse_size(cell["size"])
+        if not cell["material"] or size is None:
+            return None
+        parts.append({
+            "part_no": cell["part_no"],
+            "part_name": cell["part_name"],
+            "material": cell["material"],
+            "size": size,
+            "unit_qty": unit_qty,
+            "remarks": cell["remarks"],
+        })
+
+    page_text = " ".join(w[4] for w in words)
+    match = MTG_PATTERN.search(page_text)
+    if not match:
+        return None
+    return {"table_found": True, "mtg_no": f"MTG{match.group(1)}", "parts": parts, "source": "text"}
+
+
+def page_count(pdf_path: str) -> Optional[int]:
+    """Number of pages, or None when PyMuPDF is missing or cannot open the file."""
+    pymupdf = _pymupdf()
+    if pymupdf is None:
+        return None
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            return doc.page_count
+    except Exception:
+        return None
+
+
+def extract_text_tables(pdf_path: str) -> Dict[int, Dict]:
+    """Parse the parts table from every page that has a usable text layer.
+
+    Returns {page_number (1-based): result}; pages that are scanned or fail to parse are left out
+    so the caller can send them to the vision model. Needs PyMuPDF, otherwise returns {}.
+    """
+    pymupdf = _pymupdf()
+    if pymupdf is None:
+        return {}
+    results = {}
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            for number, page in enumerate(doc, start=1):
+                words = [tuple(w[:5]) for w in page.get_text("words")]
+                if not words:
+                    continue
+                result = parse_page_words(words)
+                if result is not None:
+                    results[number] = result
+    except Exception as e:
+        print(f"Text layer parse failed, using vision for every page: {e}")
+        return {}
+    return results
+